@@ -8,11 +8,17 @@ from dotenv import (
 load_dotenv()
 
 
-# Markets-Bridge
-mb_domain = os.getenv('MB_DOMAIN')
+def _getenv_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+
+    if value is None:
+        return default
+
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
 
-if not mb_domain:
-    raise ValueError('MB_DOMAIN not set')
+
+# Markets-Bridge
+mb_domain = os.getenv('MB_DOMAIN', default='')
 
 mb_categories_url = mb_domain + 'api/v1/provider/categories/'
 mb_products_url = mb_domain + 'api/v1/provider/products/'
@@ -26,15 +32,9 @@ mb_target_categories_url = mb_domain + 'api/v1/parser_targets/categories/'
 
 marketplace_id = int(os.getenv('TOYZZ_ID', default=0))
 
-if not marketplace_id:
-    raise ValueError('TOYZZ_ID not set')
-
 mb_login = os.getenv('MB_LOGIN')
 mb_password = os.getenv('MB_PASSWORD')
 
-if not (mb_login and mb_password):
-    raise ValueError('MB_LOGIN and MB_PASSWORD not set for Markets-Bridge authentication')
-
 mb_token_url = mb_domain + 'api/token/'
 mb_token_refresh_url = mb_token_url + 'refresh/'
 mb_system_environments_url = mb_domain + 'api/v1/common/system_environments/'
@@ -42,7 +42,142 @@ mb_logs_url = mb_domain + 'api/v1/common/logs/'
 
 
 # Toyzz
-toyzz_domain = 'https://www.toyzzshop.com'
+toyzz_domain = os.getenv('TOYZZ_DOMAIN', default='https://www.toyzzshop.com')
+
+# Selenium (таймауты в секундах)
+selenium_page_load_timeout = int(os.getenv('SELENIUM_PAGE_LOAD_TIMEOUT', default=60))
+selenium_wait_timeout = int(os.getenv('SELENIUM_WAIT_TIMEOUT', default=20))
+selenium_profile_dir = os.getenv('SELENIUM_PROFILE_DIR')
+selenium_blocked_urls = [
+    pattern.strip()
+    for pattern in os.getenv(
+        'SELENIUM_BLOCKED_URLS',
+        default=(
+            '*.png,*.jpg,*.jpeg,*.gif,*.webp,*.svg,*.ico,*.mp4,*.webm,*.mp3,*.woff,*.woff2,*.ttf,*.otf,*.eot,'
+            '*google-analytics.com*,*googletagmanager.com*,*doubleclick.net*,*facebook.net*,*facebook.com/tr*,'
+            '*hotjar.com*,*criteo.com*,*criteo.net*,*yandex.ru/metrika*,*mc.yandex.*,*tiktok.com*,*clarity.ms*'
+        ),
+    ).split(',')
+    if pattern.strip()
+]
+
+# Обход каталога по sitemap
+catalog_sitemap_filter = os.getenv('CATALOG_SITEMAP_FILTER', default='product')
+catalog_shard_index = int(os.getenv('CATALOG_SHARD_INDEX', default=0))
+catalog_shard_count = int(os.getenv('CATALOG_SHARD_COUNT', default=1))
+
+# RabbitMQ
+rabbitmq_host = os.getenv('RABBITMQ_HOST', default='localhost')
+parsing_queue = f'parsing.{marketplace_id}'
+# Очередь, которую слушает воркер. Позволяет запускать отдельные воркеры для выделенной очереди товаров
+consume_queue = os.getenv('CONSUME_QUEUE') or parsing_queue
+prefetch_count = int(os.getenv('PREFETCH_COUNT', default=1))
+
+# Процессы воркеров и их лимиты, после превышения которых процесс перезапускается (0 - без ограничения)
+worker_processes = int(os.getenv('WORKER_PROCESSES', default=1))
+worker_max_messages = int(os.getenv('WORKER_MAX_MESSAGES', default=0))
+worker_max_rss_mb = int(os.getenv('WORKER_MAX_RSS_MB', default=0))
+worker_stop_timeout = int(os.getenv('WORKER_STOP_TIMEOUT', default=60))
+
+# Распределение товаров категории через очередь
+category_fanout = _getenv_bool('CATEGORY_FANOUT')
+fanout_queue = os.getenv('FANOUT_QUEUE') or parsing_queue
+fanout_batch_size = int(os.getenv('FANOUT_BATCH_SIZE', default=30))
+category_tracking = _getenv_bool('CATEGORY_TRACKING')
+
+# Сохранение прогресса обхода категорий (TTL в секундах)
+category_checkpoints = _getenv_bool('CATEGORY_CHECKPOINTS', default=True)
+category_checkpoint_ttl = int(os.getenv('CATEGORY_CHECKPOINT_TTL', default=24 * 60 * 60))
+
+# Пропуск карточек, обработанных не раньше указанного количества секунд назад (0 - не пропускать)
+seen_url_freshness = int(os.getenv('SEEN_URL_FRESHNESS', default=60 * 60))
+
+# Планирование повторного парсинга по изменчивости товаров (интервалы в секундах)
+refresh_tracking = _getenv_bool('REFRESH_TRACKING')
+refresh_min_interval = int(os.getenv('REFRESH_MIN_INTERVAL', default=60 * 60))
+refresh_max_interval = int(os.getenv('REFRESH_MAX_INTERVAL', default=7 * 24 * 60 * 60))
+refresh_low_stock_threshold = int(os.getenv('REFRESH_LOW_STOCK_THRESHOLD', default=5))
+refresh_low_stock_interval = int(os.getenv('REFRESH_LOW_STOCK_INTERVAL', default=3 * 60 * 60))
+refresh_budget_per_hour = int(os.getenv('REFRESH_BUDGET_PER_HOUR', default=1000))
+refresh_tick = int(os.getenv('REFRESH_TICK', default=60))
+refresh_queue = os.getenv('REFRESH_QUEUE') or parsing_queue
+
+# Обработка изображений перед отправкой в Markets-Bridge
+image_processing = _getenv_bool('IMAGE_PROCESSING')
+image_max_size = int(os.getenv('IMAGE_MAX_SIZE', default=1200))
+image_format = os.getenv('IMAGE_FORMAT', default='JPEG').upper()
+image_quality = int(os.getenv('IMAGE_QUALITY', default=85))
+image_processes = int(os.getenv('IMAGE_PROCESSES', default=2))
+
+# Профилирование обработки сообщений
+profiling_enabled = _getenv_bool('PROFILING_ENABLED')
+profiling_sample_rate = float(os.getenv('PROFILING_SAMPLE_RATE', default=1))
+profiling_dir = os.getenv('PROFILING_DIR', default='profiles')
+profiling_tracemalloc = _getenv_bool('PROFILING_TRACEMALLOC', default=True)
+profiling_tracemalloc_frames = int(os.getenv('PROFILING_TRACEMALLOC_FRAMES', default=10))
+profiling_top_n = int(os.getenv('PROFILING_TOP_N', default=0))
+
+# Конвейер обработки карточек товаров: потоки каждой стадии и размер очередей между стадиями
+pipeline_enabled = _getenv_bool('PIPELINE_ENABLED')
+pipeline_parse_workers = int(os.getenv('PIPELINE_PARSE_WORKERS', default=2))
+pipeline_parse_processes = int(os.getenv('PIPELINE_PARSE_PROCESSES', default=0))
+pipeline_reference_workers = int(os.getenv('PIPELINE_REFERENCE_WORKERS', default=4))
+pipeline_product_workers = int(os.getenv('PIPELINE_PRODUCT_WORKERS', default=4))
+pipeline_image_workers = int(os.getenv('PIPELINE_IMAGE_WORKERS', default=4))
+pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', default=16))
+
+# Локальное хранилище состояния воркера
+local_storage_path = os.getenv('LOCAL_STORAGE_PATH', default='toyzz_parser.sqlite3')
 
 # Sentry
 sentry_dsn = os.getenv('SENTRY_DSN')
+
+
+def validate():
+    """Проверяет обязательные параметры конфигурации.
+
+    Вызывается при запуске сервиса, а не при импорте модуля, чтобы импорт config не имел побочных эффектов.
+    """
+
+    if not mb_domain:
+        raise ValueError('MB_DOMAIN not set')
+
+    if not marketplace_id:
+        raise ValueError('TOYZZ_ID not set')
+
+    if not (mb_login and mb_password):
+        raise ValueError('MB_LOGIN and MB_PASSWORD not set for Markets-Bridge authentication')
+
+    if prefetch_count < 1 or worker_processes < 1:
+        raise ValueError('PREFETCH_COUNT and WORKER_PROCESSES must be positive')
+
+    if worker_stop_timeout < 0:
+        raise ValueError('WORKER_STOP_TIMEOUT must not be negative')
+
+    pipeline_workers = (
+        pipeline_parse_workers,
+        pipeline_reference_workers,
+        pipeline_product_workers,
+        pipeline_image_workers,
+    )
+
+    if min(pipeline_workers) < 1 or pipeline_queue_size < 1:
+        raise ValueError('PIPELINE_*_WORKERS and PIPELINE_QUEUE_SIZE must be positive')
+
+    if fanout_batch_size < 1:
+        raise ValueError('FANOUT_BATCH_SIZE must be positive')
+
+    if not 0 < refresh_min_interval <= refresh_max_interval:
+        raise ValueError('REFRESH_MIN_INTERVAL must be positive and not greater than REFRESH_MAX_INTERVAL')
+
+    if refresh_tick < 1 or refresh_budget_per_hour < 1:
+        raise ValueError('REFRESH_TICK and REFRESH_BUDGET_PER_HOUR must be positive')
+
+    if image_format not in ('JPEG', 'PNG', 'WEBP'):
+        raise ValueError('IMAGE_FORMAT must be one of JPEG, PNG, WEBP')
+
+    if not 0 <= profiling_sample_rate <= 1:
+        raise ValueError('PROFILING_SAMPLE_RATE must be in range from 0 to 1')
+
+    if not 0 <= catalog_shard_index < catalog_shard_count:
+        raise ValueError('CATALOG_SHARD_INDEX must be in range from 0 to CATALOG_SHARD_COUNT - 1')
@@ -0,0 +1,110 @@
+import time
+
+import config
+from core.storage import (
+    ensure_schema,
+    get_connection,
+)
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS category_checkpoints (
+    url TEXT PRIMARY KEY,
+    pages_count INTEGER,
+    next_page INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS category_checkpoint_products (
+    url TEXT NOT NULL,
+    product_url TEXT NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (url, product_url)
+);
+'''
+
+
+class CategoryCheckpoint:
+    """Сохраненное состояние обхода категории.
+
+    Хранит количество страниц категории, номер следующей необработанной страницы, найденные ссылки на карточки и
+    отметки об их обработке. Повторно полученная категория продолжает обход с места остановки. Состояние старше
+    CATEGORY_CHECKPOINT_TTL считается неактуальным, и обход начинается заново.
+    """
+
+    _schema_ensured = False
+
+    def __init__(self, url: str):
+        self._ensure_schema()
+        self.url = url
+        self.pages_count = None
+        self.next_page = 1
+
+        connection = get_connection()
+        row = connection.execute(
+            'SELECT pages_count, next_page, updated_at FROM category_checkpoints WHERE url = ?',
+            (url,),
+        ).fetchone()
+
+        if row and time.time() - row['updated_at'] > config.category_checkpoint_ttl:
+            self.delete()
+        elif row:
+            self.pages_count = row['pages_count']
+            self.next_page = row['next_page']
+
+    @property
+    def is_resumed(self) -> bool:
+        return self.next_page > 1
+
+    def save_page(self, page: int, pages_count: int, product_urls: list[str], processed: bool = False):
+        """Сохраняет ссылки с загруженной страницы категории и переносит отметку на следующую страницу."""
+
+        connection = get_connection()
+        self.pages_count = pages_count
+        self.next_page = page + 1
+
+        with connection:
+            connection.execute('BEGIN')
+            connection.executemany(
+                'INSERT OR IGNORE INTO category_checkpoint_products (url, product_url, processed) VALUES (?, ?, ?)',
+                [(self.url, product_url, int(processed)) for product_url in product_urls],
+            )
+            connection.execute(
+                'INSERT OR REPLACE INTO category_checkpoints (url, pages_count, next_page, updated_at) '
+                'VALUES (?, ?, ?, ?)',
+                (self.url, self.pages_count, self.next_page, time.time()),
+            )
+
+    def get_unprocessed_product_urls(self) -> list[str]:
+        rows = get_connection().execute(
+            'SELECT product_url FROM category_checkpoint_products WHERE url = ? AND processed = 0',
+            (self.url,),
+        ).fetchall()
+
+        return [row['product_url'] for row in rows]
+
+    def mark_processed(self, product_url: str):
+        connection = get_connection()
+        connection.execute(
+            'UPDATE category_checkpoint_products SET processed = 1 WHERE url = ? AND product_url = ?',
+            (self.url, product_url),
+        )
+        connection.execute(
+            'UPDATE category_checkpoints SET updated_at = ? WHERE url = ?',
+            (time.time(), self.url),
+        )
+
+    def delete(self):
+        """Удаляет состояние обхода. Вызывается после полной обработки категории."""
+
+        connection = get_connection()
+
+        with connection:
+            connection.execute('BEGIN')
+            connection.execute('DELETE FROM category_checkpoint_products WHERE url = ?', (self.url,))
+            connection.execute('DELETE FROM category_checkpoints WHERE url = ?', (self.url,))
+
+    @classmethod
+    def _ensure_schema(cls):
+        if not cls._schema_ensured:
+            ensure_schema(SCHEMA)
+            cls._schema_ensured = True
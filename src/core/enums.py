@@ -1,16 +1,19 @@
-from core.utils import (
-    category_processing,
-    product_card_processing,
+from importlib import (
+    import_module,
 )
 
 
 class EntityType:
     PRODUCT = 'PRODUCT'
     CATEGORY = 'CATEGORY'
+    CATALOG = 'CATALOG'
 
+    # Функции обработки указаны путями и импортируются при первом обращении, чтобы воркер не загружал при старте
+    # зависимости тех типов сущностей, которые он не обрабатывает.
     PROCESSING_MAP = {
-        PRODUCT: product_card_processing,
-        CATEGORY: category_processing
+        PRODUCT: 'core.utils.product_card_processing',
+        CATEGORY: 'core.utils.category_processing',
+        CATALOG: 'core.utils.catalog_processing',
     }
 
     @classmethod
@@ -18,4 +21,7 @@ class EntityType:
         if entity_type not in cls.PROCESSING_MAP:
             raise ValueError(f'Entity type {entity_type} does not exist.')
 
-        return cls.PROCESSING_MAP.get(entity_type)
+        module_path, function_name = cls.PROCESSING_MAP[entity_type].rsplit('.', 1)
+        module = import_module(module_path)
+
+        return getattr(module, function_name)
@@ -0,0 +1,105 @@
+import collections
+import logging
+import multiprocessing
+from concurrent.futures import (
+    ProcessPoolExecutor,
+)
+from io import (
+    BytesIO,
+)
+from typing import (
+    Iterable,
+    Iterator,
+)
+
+import config
+
+
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+}
+
+_executor = None
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """Возвращает пул процессов для обработки изображений, создавая его при первом обращении."""
+
+    global _executor
+
+    if _executor is None:
+        # spawn вместо fork: пул может создаваться из потока конвейера, а fork многопоточного процесса небезопасен
+        _executor = ProcessPoolExecutor(
+            max_workers=config.image_processes,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    return _executor
+
+
+def process_images(images: Iterable[bytes]) -> Iterator[tuple[bytes, str]]:
+    """Генератор обработанных в пуле процессов изображений.
+
+    Возвращает пары (содержимое, расширение файла) в порядке images. Изображения читаются из images по мере
+    обработки, и одновременно в пуле находится не больше IMAGE_PROCESSES изображений, поэтому в памяти не
+    накапливаются все изображения товара. Если изображение не удалось обработать, возвращается оригинал.
+    """
+
+    executor = get_image_executor()
+    pending = collections.deque()
+
+    for image in images:
+        future = executor.submit(
+            transcode_image,
+            image,
+            config.image_max_size,
+            config.image_format,
+            config.image_quality,
+        )
+        pending.append((image, future))
+
+        if len(pending) >= config.image_processes:
+            yield _get_processed_image(*pending.popleft())
+
+    while pending:
+        yield _get_processed_image(*pending.popleft())
+
+
+def _get_processed_image(image: bytes, future) -> tuple[bytes, str]:
+    try:
+        return future.result()
+    except Exception as e:
+        logging.warning(f'Image was not processed ({e.__class__.__name__}): {e}. The original will be sent')
+
+        return image, 'jpg'
+
+
+def transcode_image(image: bytes, max_size: int, image_format: str, quality: int) -> tuple[bytes, str]:
+    """Уменьшает изображение до max_size по большей стороне и перекодирует его в image_format без метаданных.
+
+    Выполняется в процессе пула, поэтому принимает параметры явно, а не читает их из config.
+    """
+
+    from PIL import (
+        Image,
+    )
+
+    with Image.open(BytesIO(image)) as source:
+        source.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+        if image_format == 'JPEG' and source.mode != 'RGB':
+            # В JPEG нет прозрачности, поэтому прозрачные области заливаются белым
+            rgba_image = source.convert('RGBA')
+            result = Image.new('RGB', rgba_image.size, (255, 255, 255))
+            result.paste(rgba_image, mask=rgba_image.getchannel('A'))
+        else:
+            result = source.copy()
+
+    # Без info при сохранении не записываются метаданные оригинала (EXIF, XMP, ICC)
+    result.info = {}
+    output = BytesIO()
+    result.save(output, format=image_format, quality=quality, optimize=True)
+
+    return output.getvalue(), IMAGE_EXTENSIONS[image_format]
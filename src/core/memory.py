@@ -0,0 +1,62 @@
+import gc
+import logging
+import os
+import resource
+
+import config
+
+
+def get_rss() -> int:
+    """Возвращает текущий размер резидентной памяти процесса в байтах.
+
+    На системах без /proc возвращается пиковое значение, что для проверки превышения лимита допустимо.
+    """
+
+    try:
+        with open('/proc/self/statm') as file:
+            resident_pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # В Linux ru_maxrss измеряется в килобайтах, в macOS - в байтах
+        return max_rss if os.uname().sysname == 'Darwin' else max_rss * 1024
+
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class WorkerLimits:
+    """Лимиты процесса воркера, после превышения которых он должен быть перезапущен.
+
+    Воркер перезапускается после обработки WORKER_MAX_MESSAGES сообщений или при превышении WORKER_MAX_RSS_MB
+    резидентной памяти. Нулевое значение отключает соответствующий лимит.
+    """
+
+    def __init__(self):
+        self.processed_messages = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        return bool(config.worker_max_messages or config.worker_max_rss_mb)
+
+    def register_message(self):
+        self.processed_messages += 1
+
+        if config.worker_max_rss_mb:
+            # Перед замером собираем циклические ссылки, чтобы не перезапускать воркер из-за отложенного мусора
+            gc.collect()
+
+    def is_exceeded(self) -> bool:
+        if config.worker_max_messages and self.processed_messages >= config.worker_max_messages:
+            logging.info(f'Worker has processed {self.processed_messages} messages and will be recycled')
+
+            return True
+
+        if config.worker_max_rss_mb:
+            rss_mb = get_rss() / 1024 / 1024
+
+            if rss_mb > config.worker_max_rss_mb:
+                logging.info(f'Worker uses {rss_mb:.0f} MB of memory and will be recycled')
+
+                return True
+
+        return False
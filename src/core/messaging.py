@@ -0,0 +1,98 @@
+import json
+import logging
+
+import pika
+from pika.exceptions import (
+    AMQPChannelError,
+    AMQPConnectionError,
+)
+
+import config
+from markets_bridge.utils import (
+    Singleton,
+)
+
+
+class TargetPublisher(Singleton):
+    """Отправитель целей парсинга в очередь RabbitMQ.
+
+    Держит отдельное от потребителя соединение, которое открывается при первой публикации и переоткрывается, если
+    было разорвано.
+    """
+
+    def __init__(self):
+        if not self._initialized:
+            self._connection = None
+            self._channel = None
+            self._declared_queues = set()
+
+            self._initialized = True
+
+    def publish(self, entity_type: str, urls: list[str], queue: str = None, options: dict = None):
+        """Публикует по одному сообщению на каждый url.
+
+        При разрыве соединения после переподключения публикуются только сообщения, которые не были отправлены до
+        разрыва, чтобы цели не попадали в очередь дважды.
+
+        Args:
+            entity_type: тип сущности из EntityType;
+            urls: адреса целей;
+            queue: очередь назначения, по умолчанию - очередь распределения товаров;
+            options: параметры обработки, передаваемые в функцию обработки.
+        """
+
+        queue = queue or config.fanout_queue
+        published_count = 0
+
+        try:
+            for url in urls:
+                self._publish(entity_type, url, queue, options)
+                published_count += 1
+        except (AMQPConnectionError, AMQPChannelError):
+            logging.warning('Connection to RabbitMQ was lost. Reconnecting...')
+            self.close()
+
+            for url in urls[published_count:]:
+                self._publish(entity_type, url, queue, options)
+
+    def close(self):
+        if self._connection and self._connection.is_open:
+            self._connection.close()
+
+        self._connection = None
+        self._channel = None
+        self._declared_queues.clear()
+
+    def _publish(self, entity_type: str, url: str, queue: str, options: dict = None):
+        channel = self._get_channel()
+
+        if queue not in self._declared_queues:
+            channel.queue_declare(queue)
+            self._declared_queues.add(queue)
+
+        message = {'type': entity_type, 'url': url}
+
+        if options:
+            message['options'] = options
+
+        channel.basic_publish(exchange='', routing_key=queue, body=json.dumps(message))
+
+    def _get_channel(self):
+        if self._channel is None or self._channel.is_closed:
+            connection_parameters = pika.ConnectionParameters(host=config.rabbitmq_host, heartbeat=300)
+            self._connection = pika.BlockingConnection(connection_parameters)
+            self._channel = self._connection.channel()
+
+        return self._channel
+
+
+def publish_targets(entity_type: str, urls: list[str], queue: str = None, options: dict = None):
+    """Публикует цели парсинга пачками по FANOUT_BATCH_SIZE."""
+
+    publisher = TargetPublisher()
+    batch_size = config.fanout_batch_size
+
+    for start in range(0, len(urls), batch_size):
+        batch = urls[start:start + batch_size]
+        publisher.publish(entity_type, batch, queue=queue, options=options)
+        logging.info(f'{len(batch)} {entity_type.lower()} targets were published to the queue')
@@ -0,0 +1,215 @@
+import logging
+import queue
+import threading
+from dataclasses import (
+    dataclass,
+)
+from typing import (
+    Callable,
+    Iterable,
+)
+
+
+# Сигнал завершения работы для потоков стадии
+_STOP = object()
+
+# Запущенные конвейеры процесса, которые останавливает stop_running_pipelines
+_running_pipelines = set()
+_running_pipelines_lock = threading.Lock()
+
+
+@dataclass
+class Stage:
+    """Стадия конвейера.
+
+    Attributes:
+        name: название стадии для логов и статистики;
+        function: функция обработки одного элемента;
+        workers: количество потоков стадии;
+        fan_out: функция возвращает коллекцию, каждый элемент которой передается следующей стадии отдельно.
+    """
+
+    name: str
+    function: Callable
+    workers: int = 1
+    fan_out: bool = False
+
+
+class PipelineStopped(Exception):
+    """Конвейер был остановлен до обработки всех элементов."""
+
+
+class _Job:
+    """Входной элемент конвейера, количество еще не завершенных элементов, полученных из него, и флаг ошибки."""
+
+    __slots__ = ('item', 'pending', 'is_failed')
+
+    def __init__(self, item):
+        self.item = item
+        self.pending = 1
+        self.is_failed = False
+
+
+class Pipeline:
+    """Конвейер обработки с отдельными потоками на каждую стадию.
+
+    Стадии связаны ограниченными очередями: если стадия не успевает, предыдущие блокируются на передаче элемента,
+    поэтому количество элементов в обработке не превышает суммы размеров очередей. Ошибка обработки элемента
+    передается в on_error и не останавливает конвейер, элемент дальше не передается. После stop() потоки
+    дообрабатывают только текущие элементы, остальные пропускаются.
+
+    on_item_done вызывается с входным элементом и флагом ошибки, когда все полученные из него элементы прошли
+    последнюю стадию, были отброшены стадией с fan_out или завершились ошибкой. Флаг равен True, если хотя бы одна
+    стадия завершилась ошибкой на элементе, полученном из входного. Для элементов, пропущенных после stop(), он не
+    вызывается.
+    """
+
+    def __init__(self, stages: list[Stage], queue_size: int = 16, on_error: Callable = None,
+                 on_item_done: Callable = None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.on_item_done = on_item_done
+        self.stats = {stage.name: {'processed': 0, 'failed': 0} for stage in stages}
+
+        self._queues = []
+        self._remaining_workers = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def run(self, items: Iterable):
+        """Пропускает элементы через все стадии и ожидает завершения обработки.
+
+        Элементы читаются из items по мере освобождения места в первой очереди, поэтому items может быть генератором.
+        Если конвейер был остановлен через stop(), после завершения потоков выбрасывается PipelineStopped.
+        """
+
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._remaining_workers = [stage.workers for stage in self.stages]
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), name=f'{stage.name}-{number}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        with _running_pipelines_lock:
+            _running_pipelines.add(self)
+
+        try:
+            for item in items:
+                if self._stopping.is_set():
+                    break
+
+                self._queues[0].put((_Job(item), item))
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._queues[0].put(_STOP)
+
+            for thread in threads:
+                thread.join()
+
+            with _running_pipelines_lock:
+                _running_pipelines.discard(self)
+
+        if self._stopping.is_set():
+            raise PipelineStopped(f'Pipeline was stopped: {self.stats}')
+
+        return self.stats
+
+    def stop(self):
+        """Прекращает прием новых элементов и обработку ожидающих в очередях.
+
+        run() возвращается после того, как потоки стадий дообработают текущие элементы.
+        """
+
+        self._stopping.set()
+
+    def _work(self, index: int):
+        stage = self.stages[index]
+        input_queue = self._queues[index]
+        output_queue = self._queues[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            task = input_queue.get()
+
+            if task is _STOP:
+                break
+
+            if self._stopping.is_set():
+                continue
+
+            job, item = task
+
+            try:
+                result = stage.function(item)
+            except Exception as e:
+                self._register_failure(stage, item, e)
+                job.is_failed = True
+                self._finish(job)
+                continue
+
+            with self._lock:
+                self.stats[stage.name]['processed'] += 1
+
+            if output_queue is None:
+                self._finish(job)
+                continue
+
+            output_items = list(result) if stage.fan_out else [result]
+
+            # Счетчик увеличивается до передачи элементов, чтобы следующая стадия не завершила задание раньше времени
+            with self._lock:
+                job.pending += len(output_items)
+
+            for output_item in output_items:
+                output_queue.put((job, output_item))
+
+            self._finish(job)
+
+        with self._lock:
+            self._remaining_workers[index] -= 1
+            is_last_worker = not self._remaining_workers[index]
+
+        # Следующая стадия завершается только после того, как все потоки текущей передали ей свои элементы
+        if is_last_worker and output_queue is not None:
+            for _ in range(self.stages[index + 1].workers):
+                output_queue.put(_STOP)
+
+    def _finish(self, job: _Job):
+        with self._lock:
+            job.pending -= 1
+            is_done = not job.pending
+
+        if not is_done or not self.on_item_done:
+            return
+
+        try:
+            self.on_item_done(job.item, job.is_failed)
+        except Exception:
+            logging.exception(f'Pipeline completion handler failed for {job.item}')
+
+    def _register_failure(self, stage: Stage, item, error: Exception):
+        with self._lock:
+            self.stats[stage.name]['failed'] += 1
+
+        if not self.on_error:
+            logging.error(f'Pipeline stage "{stage.name}" failed for {item}: {error}')
+
+            return
+
+        try:
+            self.on_error(error)
+        except Exception:
+            logging.exception(f'Error handler of pipeline stage "{stage.name}" failed')
+
+
+def stop_running_pipelines():
+    """Останавливает все запущенные в процессе конвейеры. Может вызываться из любого потока."""
+
+    with _running_pipelines_lock:
+        pipelines = list(_running_pipelines)
+
+    for pipeline in pipelines:
+        pipeline.stop()
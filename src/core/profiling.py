@@ -0,0 +1,156 @@
+import cProfile
+import hashlib
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import time
+import tracemalloc
+from contextlib import (
+    contextmanager,
+)
+from datetime import (
+    datetime,
+)
+
+import config
+
+
+class SlowestMessages:
+    """Top-N самых долгих сообщений с момента запуска воркера.
+
+    При каждом изменении списка он сохраняется в slowest-<pid>.json в директории профилей. В имени файла есть pid,
+    чтобы процессы воркеров под супервизором не перезаписывали списки друг друга.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._heap = []
+        self._counter = 0
+
+    def add(self, record: dict):
+        if self._size <= 0:
+            return
+
+        # Счетчик нужен, чтобы при равной длительности не сравнивались словари
+        self._counter += 1
+        item = (record['duration'], self._counter, record)
+
+        if len(self._heap) < self._size:
+            heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+        else:
+            return
+
+        self._dump()
+
+    def get_records(self) -> list[dict]:
+        return [record for _, _, record in sorted(self._heap, key=lambda item: item[0], reverse=True)]
+
+    def _dump(self):
+        os.makedirs(config.profiling_dir, exist_ok=True)
+        path = os.path.join(config.profiling_dir, f'slowest-{os.getpid()}.json')
+
+        with open(path, 'w') as file:
+            json.dump(self.get_records(), file, ensure_ascii=False, indent=2)
+
+
+slowest_messages = SlowestMessages(config.profiling_top_n)
+
+
+@contextmanager
+def profile_message(entity_type: str, url: str, force: bool = False):
+    """Замеряет обработку сообщения и, если профилирование включено, профилирует ее.
+
+    Профилирование включается переменной PROFILING_ENABLED с долей выборки PROFILING_SAMPLE_RATE или флагом
+    profile в параметрах сообщения (options). Для профилируемого сообщения сохраняются статистика cProfile (.prof),
+    снимок tracemalloc (.tracemalloc) и описание с url и замерами (.json).
+
+    cProfile профилирует только поток обработки сообщения. При PIPELINE_ENABLED карточки категорий и каталога
+    обрабатываются потоками конвейера, поэтому их работа не попадает в .prof. Длительность, процессорное время и
+    снимок tracemalloc относятся ко всему процессу, так что для профиля функций такие сообщения стоит
+    профилировать с выключенным конвейером.
+
+    Args:
+        entity_type: тип сущности сообщения;
+        url: адрес цели;
+        force: профилировать независимо от настроек выборки.
+    """
+
+    is_profiled = force or (config.profiling_enabled and random.random() < config.profiling_sample_rate)
+    profiler = None
+    is_tracing_memory = False
+
+    if is_profiled:
+        profiler = cProfile.Profile()
+
+        if config.profiling_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start(config.profiling_tracemalloc_frames)
+            is_tracing_memory = True
+
+    started_at = datetime.now()
+    wall_started_at = time.perf_counter()
+    cpu_started_at = time.process_time()
+
+    if profiler:
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+
+        record = {
+            'type': entity_type,
+            'url': url,
+            'started_at': started_at.isoformat(),
+            'duration': round(time.perf_counter() - wall_started_at, 3),
+            'cpu_time': round(time.process_time() - cpu_started_at, 3),
+        }
+
+        if profiler:
+            try:
+                _dump_profile(record, profiler, is_tracing_memory)
+            finally:
+                # Иначе при ошибке сохранения (например, нет места на диске) tracemalloc остался бы включенным
+                if is_tracing_memory:
+                    tracemalloc.stop()
+
+        slowest_messages.add(record)
+
+
+def _dump_profile(record: dict, profiler: cProfile.Profile, is_tracing_memory: bool):
+    os.makedirs(config.profiling_dir, exist_ok=True)
+    base_path = os.path.join(config.profiling_dir, _get_profile_name(record))
+    record['profile'] = f'{base_path}.prof'
+    profiler.dump_stats(record['profile'])
+
+    if is_tracing_memory:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak_memory = tracemalloc.get_traced_memory()
+
+        record['memory_peak'] = peak_memory
+        record['memory_snapshot'] = f'{base_path}.tracemalloc'
+        record['memory_top'] = [str(stat) for stat in snapshot.statistics('lineno')[:10]]
+        snapshot.dump(record['memory_snapshot'])
+
+    with open(f'{base_path}.json', 'w') as file:
+        json.dump(record, file, ensure_ascii=False, indent=2)
+
+    logging.info(f'Message was profiled in {record["duration"]} s. Profile: {record["profile"]}')
+
+
+def _get_profile_name(record: dict) -> str:
+    """Возвращает имя файлов профиля: время, тип, читаемая часть url, хэш url и длительность."""
+
+    url_path = record['url'].rstrip('/').rsplit('/', 1)[-1]
+    url_slug = re.sub(r'[^a-zA-Z0-9_-]+', '-', url_path)[:60].strip('-')
+    url_hash = hashlib.md5(record['url'].encode()).hexdigest()[:8]
+    started_at = record['started_at'].replace(':', '').replace('-', '').split('.')[0]
+    duration = int(record['duration'] * 1000)
+
+    return f'{started_at}_{record["type"].lower()}_{url_slug}_{url_hash}_{duration}ms'
@@ -0,0 +1,208 @@
+import logging
+import time
+
+import config
+from core.storage import (
+    ensure_schema,
+    get_connection,
+)
+from toyzz.dtos import (
+    ToyzzProductDTO,
+)
+from toyzz.utils import (
+    clean_query_in_url,
+)
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS product_observations (
+    variant_id INTEGER PRIMARY KEY,
+    card_url TEXT NOT NULL,
+    price REAL NOT NULL,
+    discounted_price REAL NOT NULL,
+    stock INTEGER NOT NULL,
+    observations INTEGER NOT NULL DEFAULT 1,
+    changes INTEGER NOT NULL DEFAULT 0,
+    last_seen_at REAL NOT NULL,
+    last_changed_at REAL,
+    priority REAL NOT NULL DEFAULT 0,
+    next_refresh_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS product_observations_next_refresh_at ON product_observations (next_refresh_at);
+'''
+
+
+class RefreshScheduler:
+    """Планировщик повторного парсинга товаров по их изменчивости.
+
+    Для каждого варианта товара хранится, как часто меняются его цены и остаток. Часто меняющиеся варианты и
+    варианты с малым остатком обновляются чаще, стабильные - реже. Карточки ставятся в очередь в порядке
+    приоритета в пределах общего бюджета запросов к Toyzz.
+    """
+
+    _schema_ensured = False
+
+    @classmethod
+    def record(cls, product: ToyzzProductDTO):
+        """Сохраняет наблюдение за вариантом товара и назначает время следующего обновления."""
+
+        cls._ensure_schema()
+        connection = get_connection()
+        now = time.time()
+        row = connection.execute(
+            'SELECT price, discounted_price, stock, observations, changes, last_changed_at '
+            'FROM product_observations WHERE variant_id = ?',
+            (product.id,),
+        ).fetchone()
+
+        if row:
+            is_changed = (
+                row['price'] != product.price
+                or row['discounted_price'] != product.discounted_price
+                or row['stock'] != product.stock
+            )
+            observations = row['observations'] + 1
+            changes = row['changes'] + int(is_changed)
+            last_changed_at = now if is_changed else row['last_changed_at']
+        else:
+            observations = 1
+            changes = 0
+            last_changed_at = None
+
+        change_rate = get_change_rate(changes, observations)
+        is_low_stock = product.stock <= config.refresh_low_stock_threshold
+        interval = get_refresh_interval(change_rate, is_low_stock)
+
+        connection.execute(
+            'INSERT OR REPLACE INTO product_observations '
+            '(variant_id, card_url, price, discounted_price, stock, observations, changes, last_seen_at, '
+            'last_changed_at, priority, next_refresh_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                product.id,
+                clean_query_in_url(product.url),
+                product.price,
+                product.discounted_price,
+                product.stock,
+                observations,
+                changes,
+                now,
+                last_changed_at,
+                change_rate + int(is_low_stock),
+                now + interval,
+            ),
+        )
+
+    @classmethod
+    def plan(cls, limit: int) -> list[str]:
+        """Возвращает до limit карточек, которым пора обновиться, в порядке убывания приоритета.
+
+        Выбранным карточкам сразу назначается следующее время обновления, чтобы они не попали в план повторно до
+        того, как воркер их обработает.
+        """
+
+        if limit <= 0:
+            return []
+
+        cls._ensure_schema()
+        connection = get_connection()
+        now = time.time()
+        rows = connection.execute(
+            'SELECT card_url, MAX(priority) AS card_priority, MIN(next_refresh_at) AS due_at '
+            'FROM product_observations WHERE next_refresh_at <= ? '
+            'GROUP BY card_url ORDER BY card_priority DESC, due_at ASC LIMIT ?',
+            (now, limit),
+        ).fetchall()
+        card_urls = [row['card_url'] for row in rows]
+
+        for card_url in card_urls:
+            connection.execute(
+                'UPDATE product_observations SET next_refresh_at = ? WHERE card_url = ?',
+                (now + config.refresh_min_interval, card_url),
+            )
+
+        return card_urls
+
+    @classmethod
+    def _ensure_schema(cls):
+        if not cls._schema_ensured:
+            ensure_schema(SCHEMA)
+            cls._schema_ensured = True
+
+
+def get_change_rate(changes: int, observations: int) -> float:
+    """Возвращает сглаженную долю сравнений, в которых вариант изменился.
+
+    Первое наблюдение не с чем сравнивать, поэтому сравнений на одно меньше, чем наблюдений. К изменениям и
+    неизменениям добавляется по одному (сглаживание Лапласа), чтобы новые товары не попадали сразу в крайние
+    значения: без сравнений доля равна 0.5, после трех изменений в трех сравнениях - 0.8.
+    """
+
+    comparisons = observations - 1
+
+    return (changes + 1) / (comparisons + 2)
+
+
+def get_refresh_interval(change_rate: float, is_low_stock: bool) -> float:
+    """Возвращает интервал до следующего обновления варианта (в секундах)."""
+
+    min_interval = config.refresh_min_interval
+    max_interval = config.refresh_max_interval
+    interval = min_interval + (max_interval - min_interval) * (1 - change_rate) ** 2
+
+    if is_low_stock:
+        interval = min(interval, config.refresh_low_stock_interval)
+
+    return interval
+
+
+class RequestBudget:
+    """Бюджет запросов к Toyzz, пополняемый равномерно (token bucket)."""
+
+    def __init__(self, requests_per_hour: int, period: int):
+        self._rate = requests_per_hour / 3600
+        # Неизрасходованный бюджет копится не дольше одного периода планирования
+        self._capacity = max(self._rate * period, 1)
+        self._tokens = 0.0
+        self._updated_at = time.monotonic()
+
+    def take_available(self) -> int:
+        """Забирает и возвращает целое количество доступных запросов."""
+
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._updated_at) * self._rate, self._capacity)
+        self._updated_at = now
+        available = int(self._tokens)
+        self._tokens -= available
+
+        return available
+
+    def give_back(self, count: int):
+        """Возвращает неиспользованные запросы в бюджет."""
+
+        self._tokens = min(self._tokens + count, self._capacity)
+
+
+def run_refresh_scheduler():
+    """Периодически ставит в очередь карточки, которым пора обновиться, в пределах бюджета запросов."""
+
+    from core.enums import (
+        EntityType,
+    )
+    from core.messaging import (
+        TargetPublisher,
+    )
+
+    budget = RequestBudget(config.refresh_budget_per_hour, config.refresh_tick)
+    publisher = TargetPublisher()
+
+    while True:
+        available = budget.take_available()
+        card_urls = RefreshScheduler.plan(available)
+        budget.give_back(available - len(card_urls))
+
+        if card_urls:
+            publisher.publish(EntityType.PRODUCT, card_urls, queue=config.refresh_queue)
+            logging.info(f'{len(card_urls)} products were scheduled for refresh')
+
+        time.sleep(config.refresh_tick)
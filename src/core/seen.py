@@ -0,0 +1,83 @@
+import time
+
+import config
+from core.storage import (
+    ensure_schema,
+    get_connection,
+)
+from toyzz.utils import (
+    clean_query_in_url,
+)
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS seen_urls (
+    url TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS seen_urls_seen_at ON seen_urls (seen_at);
+'''
+
+# Ограничение SQLite на количество параметров в одном запросе
+MAX_QUERY_PARAMETERS = 500
+
+
+class SeenUrlIndex:
+    """Индекс недавно обработанных карточек товаров.
+
+    Ключ - адрес карточки, очищенный clean_query_in_url. Карточки, обработанные в пределах SEEN_URL_FRESHNESS
+    секунд, пропускаются при обходе категорий.
+    """
+
+    _schema_ensured = False
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return config.seen_url_freshness > 0
+
+    @classmethod
+    def filter_unseen(cls, urls: list[str]) -> list[str]:
+        """Возвращает адреса, которые не обрабатывались в пределах окна свежести, сохраняя их порядок."""
+
+        cls._ensure_schema()
+        connection = get_connection()
+        fresh_since = time.time() - config.seen_url_freshness
+        seen_urls = set()
+
+        for start in range(0, len(urls), MAX_QUERY_PARAMETERS):
+            chunk = [clean_query_in_url(url) for url in urls[start:start + MAX_QUERY_PARAMETERS]]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = connection.execute(
+                f'SELECT url FROM seen_urls WHERE seen_at >= ? AND url IN ({placeholders})',
+                (fresh_since, *chunk),
+            ).fetchall()
+            seen_urls.update(row['url'] for row in rows)
+
+        return [url for url in urls if clean_query_in_url(url) not in seen_urls]
+
+    @classmethod
+    def mark(cls, urls: list[str]):
+        """Отмечает адреса как обработанные сейчас."""
+
+        cls._ensure_schema()
+        now = time.time()
+        get_connection().executemany(
+            'INSERT OR REPLACE INTO seen_urls (url, seen_at) VALUES (?, ?)',
+            [(clean_query_in_url(url), now) for url in urls],
+        )
+
+    @classmethod
+    def prune(cls):
+        """Удаляет записи, вышедшие за окно свежести."""
+
+        cls._ensure_schema()
+        get_connection().execute(
+            'DELETE FROM seen_urls WHERE seen_at < ?',
+            (time.time() - config.seen_url_freshness,),
+        )
+
+    @classmethod
+    def _ensure_schema(cls):
+        if not cls._schema_ensured:
+            ensure_schema(SCHEMA)
+            cls._schema_ensured = True
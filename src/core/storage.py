@@ -0,0 +1,31 @@
+import sqlite3
+import threading
+
+import config
+
+
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Возвращает соединение с локальным хранилищем состояния воркера.
+
+    Соединение создается одно на поток. Хранилище может одновременно использоваться несколькими процессами воркеров
+    на одном узле.
+    """
+
+    connection = getattr(_local, 'connection', None)
+
+    if connection is None:
+        connection = sqlite3.connect(config.local_storage_path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.row_factory = sqlite3.Row
+        _local.connection = connection
+
+    return connection
+
+
+def ensure_schema(schema: str):
+    """Создает таблицы схемы, если их еще нет."""
+
+    get_connection().executescript(schema)
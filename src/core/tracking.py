@@ -0,0 +1,106 @@
+import logging
+import time
+import uuid
+
+from core.storage import (
+    ensure_schema,
+    get_connection,
+)
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS category_crawls (
+    crawl_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    expected INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    collected INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+'''
+
+
+class CategoryCrawlTracker:
+    """Отслеживание завершения обработки категории, товары которой распределены через очередь.
+
+    Состояние хранится в локальном хранилище, поэтому отслеживание работает только для воркеров одного узла,
+    использующих одно хранилище (LOCAL_STORAGE_PATH). Для распределения карточек между несколькими узлами
+    отслеживание не поддерживается: узел, не знающий обхода, не может отметить его карточки, и такие отметки
+    попадают в лог как предупреждения.
+    """
+
+    _schema_ensured = False
+
+    @classmethod
+    def start(cls, url: str) -> str:
+        """Регистрирует обход категории и возвращает его идентификатор."""
+
+        cls._ensure_schema()
+        crawl_id = uuid.uuid4().hex
+        get_connection().execute(
+            'INSERT INTO category_crawls (crawl_id, url, started_at) VALUES (?, ?, ?)',
+            (crawl_id, url, time.time()),
+        )
+
+        return crawl_id
+
+    @classmethod
+    def add_expected(cls, crawl_id: str, count: int):
+        """Увеличивает количество ожидаемых к обработке карточек."""
+
+        cls._ensure_schema()
+        get_connection().execute(
+            'UPDATE category_crawls SET expected = expected + ? WHERE crawl_id = ?',
+            (count, crawl_id),
+        )
+
+    @classmethod
+    def finish_collecting(cls, crawl_id: str):
+        """Отмечает, что все карточки категории отправлены в очередь."""
+
+        cls._ensure_schema()
+        get_connection().execute('UPDATE category_crawls SET collected = 1 WHERE crawl_id = ?', (crawl_id,))
+        cls._check_completion(crawl_id)
+
+    @classmethod
+    def mark_processed(cls, crawl_id: str):
+        """Отмечает обработку одной карточки категории, в том числе неудачную."""
+
+        cls._ensure_schema()
+        cursor = get_connection().execute(
+            'UPDATE category_crawls SET processed = processed + 1 WHERE crawl_id = ?',
+            (crawl_id,),
+        )
+
+        if not cursor.rowcount:
+            logging.warning(
+                f'Category crawl {crawl_id} is unknown to the local storage, the card was not counted. '
+                f'CATEGORY_TRACKING requires all workers to share LOCAL_STORAGE_PATH'
+            )
+
+            return
+
+        cls._check_completion(crawl_id)
+
+    @classmethod
+    def _check_completion(cls, crawl_id: str):
+        cursor = get_connection().execute(
+            'UPDATE category_crawls SET finished_at = ? '
+            'WHERE crawl_id = ? AND collected = 1 AND processed >= expected AND finished_at IS NULL '
+            'RETURNING url, processed, started_at, finished_at',
+            (time.time(), crawl_id),
+        )
+        row = cursor.fetchone()
+
+        if row:
+            logging.info(
+                f'Category was parsed completely in {row["finished_at"] - row["started_at"]:.0f} s. '
+                f'Cards processed: {row["processed"]}. URL: {row["url"]}'
+            )
+
+    @classmethod
+    def _ensure_schema(cls):
+        if not cls._schema_ensured:
+            ensure_schema(SCHEMA)
+            cls._schema_ensured = True
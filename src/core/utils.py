@@ -1,14 +1,26 @@
 import logging
+import multiprocessing
+import threading
 import time
 import traceback
 from abc import (
     ABC,
     abstractmethod,
 )
+from concurrent.futures import (
+    ProcessPoolExecutor,
+)
+from typing import (
+    Callable,
+    Iterable,
+)
 
 import requests
 
 import config
+from core.seen import (
+    SeenUrlIndex,
+)
 from markets_bridge.dtos import (
     MBBrandDTO,
     MBCategoryDTO,
@@ -29,43 +41,351 @@ from toyzz.dtos import (
     ToyzzProductDTO,
 )
 from toyzz.utils import (
+    CatalogParser,
     CategoryParser,
     ProductCardParser,
 )
 
 
-def category_processing(url: str):
-    toyzz_products = CategoryParser.parse(url)
+def category_processing(url: str, fanout: bool = None, force: bool = False):
+    """Обрабатывает товары категории.
+
+    В режиме распределения (CATEGORY_FANOUT или флаг fanout в сообщении) карточки не парсятся на месте, а
+    отправляются в очередь отдельными сообщениями PRODUCT, чтобы их обработали все воркеры.
+
+    При включенном CATEGORY_CHECKPOINTS прогресс обхода сохраняется, и повторно полученная категория продолжает
+    обработку с места остановки.
+
+    Карточки, обработанные в пределах SEEN_URL_FRESHNESS, пропускаются, если в сообщении не передан флаг force.
+    """
+
+    if fanout is None:
+        fanout = config.category_fanout
+
+    checkpoint = None
+
+    if config.category_checkpoints:
+        from core.checkpoints import (
+            CategoryCheckpoint,
+        )
+
+        checkpoint = CategoryCheckpoint(url)
+
+        if checkpoint.is_resumed:
+            logging.info(f'Category crawl is resumed from page {checkpoint.next_page}. URL: {url}')
+
+    skip_seen = not force and SeenUrlIndex.is_enabled()
+
+    if skip_seen:
+        SeenUrlIndex.prune()
+
+    # При остановке воркера конвейер выбрасывает PipelineStopped, и контрольная точка сохраняется для продолжения
+    if fanout:
+        fan_out_category(url, checkpoint, skip_seen)
+    else:
+        _process_category_inline(url, checkpoint, skip_seen)
+
+    if checkpoint:
+        checkpoint.delete()
+
+
+def _process_category_inline(url: str, checkpoint=None, skip_seen: bool = False):
+    if not checkpoint:
+        product_urls = CategoryParser.get_product_urls(url)
+
+        if skip_seen:
+            product_urls = _filter_seen_product_urls(product_urls)
+
+        process_product_cards(product_urls, skip_seen)
+
+        return
+
+    page_product_urls = CategoryParser.iter_page_product_urls(url, checkpoint.next_page, checkpoint.pages_count)
+
+    for page, pages_count, product_urls in page_product_urls:
+        if skip_seen:
+            product_urls = _filter_seen_product_urls(product_urls)
+
+        checkpoint.save_page(page, pages_count, product_urls)
+
+    process_product_cards(checkpoint.get_unprocessed_product_urls(), skip_seen, checkpoint.mark_processed)
+
+
+def process_product_cards(urls: Iterable[str], skip_seen: bool = False, on_card_processed: Callable = None):
+    """Обрабатывает набор карточек товаров.
+
+    При PIPELINE_ENABLED карточки обрабатываются конвейером со своим пулом потоков на каждую стадию (разбор
+    карточки, справочные данные, товар, изображения), иначе - последовательно. Если конвейер остановлен до
+    обработки всех карточек, выбрасывается core.pipeline.PipelineStopped.
 
-    for product in toyzz_products:
-        process_product(product)
+    Args:
+        urls: адреса карточек, может быть генератором;
+        skip_seen: пропускать карточки, обработанные в пределах SEEN_URL_FRESHNESS;
+        on_card_processed: вызывается с адресом карточки после ее обработки. В конвейере - после того, как все
+            товары карточки прошли последнюю стадию или завершились ошибкой.
+    """
 
+    if config.pipeline_enabled:
+        pipeline = create_product_pipeline(skip_seen, on_card_processed)
+        stats = pipeline.run(urls)
+        logging.info(f'Product pipeline was finished: {stats}')
 
-def product_card_processing(url: str):
-    toyzz_products = ProductCardParser.parse(url)
+        return
 
-    for product in toyzz_products:
-        process_product(product)
+    for url in urls:
+        _process_category_product_card(url, skip_seen)
+
+        if on_card_processed:
+            on_card_processed(url)
+
+
+def create_product_pipeline(skip_seen: bool = False, on_card_processed: Callable = None):
+    """Создает конвейер обработки карточек товаров с количеством потоков стадий из конфигурации."""
+
+    from core.pipeline import (
+        Pipeline,
+        Stage,
+    )
+
+    # Пропущенные карточки не отмечаются в индексе повторно, чтобы не продлевать их окно свежести
+    skipped_urls = set()
+    skipped_urls_lock = threading.Lock()
+
+    def parse_card(url: str) -> list[ToyzzProductDTO]:
+        if skip_seen and not _filter_seen_product_urls([url]):
+            with skipped_urls_lock:
+                skipped_urls.add(url)
+
+            return []
+
+        if config.pipeline_parse_processes:
+            return _get_parse_executor().submit(ProductCardParser.parse, url).result()
+
+        return ProductCardParser.parse(url)
+
+    def send_reference_data_stage(product: ToyzzProductDTO) -> ToyzzProductDTO:
+        send_reference_data(product)
+
+        return product
+
+    def send_product_stage(product: ToyzzProductDTO) -> list[tuple[ToyzzProductDTO, int]]:
+        product_id = send_product(product)
+
+        return [(product, product_id)] if product_id else []
+
+    def send_product_images_stage(item: tuple[ToyzzProductDTO, int]):
+        send_product_images(*item)
+
+    def on_card_done(url: str, is_failed: bool):
+        with skipped_urls_lock:
+            is_skipped = url in skipped_urls
+            skipped_urls.discard(url)
+
+        # Как и при последовательной обработке, в индекс попадают только карточки, все товары которых отправлены
+        if not is_failed and not is_skipped and SeenUrlIndex.is_enabled():
+            SeenUrlIndex.mark([url])
+
+        if on_card_processed:
+            on_card_processed(url)
+
+    stages = [
+        Stage('parse', parse_card, workers=config.pipeline_parse_workers, fan_out=True),
+        Stage('reference', send_reference_data_stage, workers=config.pipeline_reference_workers),
+        Stage('product', send_product_stage, workers=config.pipeline_product_workers, fan_out=True),
+        Stage('images', send_product_images_stage, workers=config.pipeline_image_workers),
+    ]
+
+    return Pipeline(
+        stages,
+        queue_size=config.pipeline_queue_size,
+        on_error=handle_exception,
+        on_item_done=on_card_done,
+    )
+
+
+_parse_executor = None
+
+
+def _get_parse_executor() -> ProcessPoolExecutor:
+    global _parse_executor
+
+    if _parse_executor is None:
+        # spawn вместо fork: пул создается из потока конвейера, а fork многопоточного процесса небезопасен
+        _parse_executor = ProcessPoolExecutor(
+            max_workers=config.pipeline_parse_processes,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    return _parse_executor
+
+
+def _process_category_product_card(url: str, skip_seen: bool = False):
+    # Между сбором ссылок и обработкой карточки ее мог обработать другой воркер
+    if skip_seen and not _filter_seen_product_urls([url]):
+        return
+
+    try:
+        product_card_processing(url)
+    except Exception as e:
+        handle_exception(e)
+
+
+def _filter_seen_product_urls(product_urls: list[str]) -> list[str]:
+    unseen_product_urls = SeenUrlIndex.filter_unseen(product_urls)
+    skipped_count = len(product_urls) - len(unseen_product_urls)
+
+    if skipped_count:
+        logging.info(f'{skipped_count} recently processed product cards were skipped')
+
+    return unseen_product_urls
+
+
+def fan_out_category(url: str, checkpoint=None, skip_seen: bool = False):
+    """Собирает ссылки на карточки категории и постранично публикует их в очередь как цели PRODUCT.
+
+    При skip_seen недавно обработанные карточки не публикуются, а опубликованные сразу отмечаются в индексе, чтобы
+    пересекающиеся категории не ставили одну карточку в очередь несколько раз.
+    """
+
+    from core.enums import (
+        EntityType,
+    )
+    from core.messaging import (
+        publish_targets,
+    )
+
+    crawl_id = None
+    options = None
+
+    if config.category_tracking:
+        from core.tracking import (
+            CategoryCrawlTracker,
+        )
+
+        crawl_id = CategoryCrawlTracker.start(url)
+        options = {'crawl_id': crawl_id}
+
+    if checkpoint:
+        page_product_urls = CategoryParser.iter_page_product_urls(url, checkpoint.next_page, checkpoint.pages_count)
+    else:
+        page_product_urls = CategoryParser.iter_page_product_urls(url)
+
+    for page, pages_count, product_urls in page_product_urls:
+        if skip_seen:
+            product_urls = _filter_seen_product_urls(product_urls)
+
+        if crawl_id:
+            CategoryCrawlTracker.add_expected(crawl_id, len(product_urls))
+
+        publish_targets(EntityType.PRODUCT, product_urls, options=options)
+
+        if skip_seen:
+            SeenUrlIndex.mark(product_urls)
+
+        if checkpoint:
+            checkpoint.save_page(page, pages_count, product_urls, processed=True)
+
+    if crawl_id:
+        CategoryCrawlTracker.finish_collecting(crawl_id)
+
+
+def product_card_processing(url: str, crawl_id: str = None):
+    try:
+        toyzz_products = ProductCardParser.parse(url)
+
+        for product in toyzz_products:
+            process_product(product)
+
+        if SeenUrlIndex.is_enabled():
+            SeenUrlIndex.mark([url])
+    finally:
+        if crawl_id:
+            from core.tracking import (
+                CategoryCrawlTracker,
+            )
+
+            CategoryCrawlTracker.mark_processed(crawl_id)
+
+
+def catalog_processing(url: str, shard_index: int = None, shard_count: int = None):
+    """Обрабатывает товары каталога из sitemap, относящиеся к одному шарду.
+
+    Если шард не передан в сообщении, используется шард воркера из конфигурации.
+    """
+
+    if shard_index is None:
+        shard_index = config.catalog_shard_index
+
+    if shard_count is None:
+        shard_count = config.catalog_shard_count
+
+    process_product_cards(CatalogParser.get_product_urls(url, shard_index, shard_count))
 
 
 def process_product(product: ToyzzProductDTO):
+    send_reference_data(product)
+    product_id = send_product(product)
+
+    if product_id:
+        send_product_images(product, product_id)
+
+
+def send_reference_data(product: ToyzzProductDTO):
+    """Отправляет справочные данные товара: категорию, бренд, характеристики и их значения."""
+
     _process_category(product)
     _process_brand(product)
     _process_characteristics(product)
     _process_characteristic_values(product)
+
+
+def send_product(product: ToyzzProductDTO) -> int | None:
+    """Отправляет товар и возвращает его идентификатор в Markets-Bridge, если товар был создан."""
+
     product_response = _process_product(product)
 
+    # Наблюдение сохраняется только после успешной отправки, иначе неудачное обновление отодвинуло бы следующее
+    if config.refresh_tracking:
+        from core.scheduling import (
+            RefreshScheduler,
+        )
+
+        RefreshScheduler.record(product)
+
     if product_response.status_code == 201:
-        existed_product = product_response.json()
-
-        for image_url in product.image_urls:
-            try:
-                image = fetch_image(image_url)
-            except IOError as e:
-                handle_exception(e)
-                continue
-            else:
-                send_image(image, existed_product['id'])
+        return product_response.json()['id']
+
+    return None
+
+
+def send_product_images(product: ToyzzProductDTO, product_id: int):
+    """Загружает изображения товара из Toyzz и отправляет их в Markets-Bridge.
+
+    Изображения загружаются и отправляются по одному, чтобы в памяти не держались все оригиналы товара сразу.
+    """
+
+    images = _fetch_product_images(product)
+
+    if config.image_processing:
+        from core.images import (
+            process_images,
+        )
+
+        processed_images = process_images(images)
+    else:
+        processed_images = ((image, 'jpg') for image in images)
+
+    for image, extension in processed_images:
+        send_image(image, product_id, extension)
+
+
+def _fetch_product_images(product: ToyzzProductDTO):
+    for image_url in product.image_urls:
+        try:
+            yield fetch_image(image_url)
+        except IOError as e:
+            handle_exception(e)
+            continue
 
 
 def _process_category(product: ToyzzProductDTO):
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Нагрузочное тестирование воркеров main.py.
+
+Сообщения PRODUCT и CATEGORY публикуются в локальный заменитель RabbitMQ, страницы Toyzz отдает локальный сервер
+со сгенерированными страницами, Markets-Bridge заменяет заглушка с настраиваемой задержкой. Для каждого сценария
+выводятся пропускная способность, перцентили задержек и потребление ресурсов.
+
+Запуск:
+    python src/load_test.py --products 300 --categories 3 \\
+        --scenario workers=1,prefetch=1 \\
+        --scenario workers=4,prefetch=2,mb_latency=50,CATEGORY_FANOUT=1
+"""
+import argparse
+import json
+
+from loadtest.runner import (
+    Scenario,
+    Workload,
+    run_scenario,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for toyzz-parser workers')
+    parser.add_argument('--products', type=int, default=100, help='PRODUCT messages count')
+    parser.add_argument('--categories', type=int, default=0, help='CATEGORY messages count (requires Chrome)')
+    parser.add_argument('--catalog-size', type=int, default=1000, help='Number of distinct fixture products')
+    parser.add_argument('--category-size', type=int, default=60, help='Products per fixture category')
+    parser.add_argument('--page-padding-kb', type=int, default=200, help='Extra markup per fixture page')
+    parser.add_argument('--image-size', type=int, default=1600, help='Side of fixture images in pixels')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=600, help='Max seconds per scenario')
+    parser.add_argument(
+        '--scenario',
+        action='append',
+        help='Comma separated parameters: workers, prefetch, mb_latency (ms) and worker environment variables',
+    )
+    parser.add_argument('--json', action='store_true', help='Print reports as JSON')
+    parser.add_argument('--verbose', action='store_true', help='Show worker logs')
+    args = parser.parse_args()
+
+    workload = Workload(
+        products=args.products,
+        categories=args.categories,
+        catalog_size=args.catalog_size,
+        category_size=args.category_size,
+        page_padding_kb=args.page_padding_kb,
+        image_size=args.image_size,
+        seed=args.seed,
+    )
+    scenarios = [Scenario.from_string(value) for value in args.scenario or ['workers=1']]
+    reports = []
+
+    for scenario in scenarios:
+        report = run_scenario(scenario, workload, args.timeout, args.verbose)
+        reports.append(report)
+
+        if not args.json:
+            print_report(report)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+
+
+def print_report(report: dict):
+    latency = report['latency']
+    processing = report['processing']
+    timed_out = ' (TIMED OUT)' if report['timed_out'] else ''
+
+    print(
+        f'{report["scenario"]}{timed_out}\n'
+        f'  messages: {report["messages"]} in {report["duration"]} s, {report["throughput"]} msg/s, '
+        f'requeued: {report["requeued"]}\n'
+        f'  latency p50/p90/p99: {latency["p50"]} / {latency["p90"]} / {latency["p99"]} s\n'
+        f'  processing p50/p90/p99: {processing["p50"]} / {processing["p90"]} / {processing["p99"]} s\n'
+        f'  cpu: {report["cpu_time"]} s, max rss per worker: {report["max_rss_mb"]} MB\n'
+        f'  requests toyzz/mb: {report["toyzz_requests"]} / {report["mb_requests"]}'
+    )
+
+
+if __name__ == '__main__':
+    main()
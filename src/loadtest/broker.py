@@ -0,0 +1,222 @@
+import collections
+import queue
+import threading
+import time
+from dataclasses import (
+    dataclass,
+)
+
+
+@dataclass
+class Delivery:
+    delivery_tag: int
+    routing_key: str
+    redelivered: bool = False
+
+
+class StandInBroker:
+    """Заменитель RabbitMQ для нагрузочного тестирования.
+
+    Очереди живут в менеджере multiprocessing, поэтому брокер можно передать в процессы воркеров. Для каждого
+    подтвержденного сообщения запоминаются пары (задержка от публикации до подтверждения, длительность обработки
+    от начала обработки до подтверждения).
+    """
+
+    def __init__(self, manager, queue_names: list[str]):
+        self._queues = {name: manager.Queue() for name in queue_names}
+        self._counters = manager.dict(published=0, acknowledged=0, requeued=0)
+        self._lock = manager.Lock()
+        self.latencies = manager.list()
+
+    @property
+    def pending(self) -> int:
+        """Количество опубликованных, но еще не подтвержденных сообщений."""
+
+        return self._counters['published'] - self._counters['acknowledged']
+
+    @property
+    def counters(self) -> dict:
+        return dict(self._counters)
+
+    def declare(self, queue_name: str):
+        if queue_name not in self._queues:
+            raise ValueError(f'Queue {queue_name} is not declared in the stand-in broker.')
+
+    def publish(self, queue_name: str, body: bytes):
+        self.declare(queue_name)
+
+        with self._lock:
+            self._counters['published'] += 1
+
+        self._queues[queue_name].put((body, time.time(), False))
+
+    def get(self, queue_name: str, timeout: float):
+        try:
+            return self._queues[queue_name].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def acknowledge(self, message: tuple, started_at: float):
+        _, published_at, _ = message
+        acknowledged_at = time.time()
+        self.latencies.append((acknowledged_at - published_at, acknowledged_at - started_at))
+
+        with self._lock:
+            self._counters['acknowledged'] += 1
+
+    def requeue(self, queue_name: str, message: tuple):
+        body, published_at, _ = message
+
+        with self._lock:
+            self._counters['requeued'] += 1
+
+        self._queues[queue_name].put((body, published_at, True))
+
+
+class StandInChannel:
+    """Канал заменителя RabbitMQ с подмножеством интерфейса pika.adapters.blocking_connection.BlockingChannel.
+
+    Полученные с prefetch сообщения могут ждать обработки в воркере, поэтому начало обработки отмечается
+    обработчиком через mark_started. Без отметки длительность обработки считается от доставки воркеру.
+    """
+
+    def __init__(self, connection: 'StandInConnection'):
+        self._connection = connection
+        self._broker = connection.broker
+        self._prefetch_count = 0
+        self._consumer = None
+        self._consuming = False
+        self._unacked = {}
+        self._started_at = {}
+        self._next_delivery_tag = 1
+        self.is_open = True
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def queue_declare(self, queue, **kwargs):
+        self._broker.declare(queue)
+
+    def basic_qos(self, prefetch_count: int = 0, **kwargs):
+        self._prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback, auto_ack: bool = False, **kwargs):
+        self._broker.declare(queue)
+        self._consumer = (queue, on_message_callback, auto_ack)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory: bool = False):
+        if isinstance(body, str):
+            body = body.encode()
+
+        self._broker.publish(routing_key, body)
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        queue_name, message, delivered_at = self._unacked.pop(delivery_tag)
+        self._broker.acknowledge(message, self._started_at.pop(delivery_tag, delivered_at))
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        queue_name, message, delivered_at = self._unacked.pop(delivery_tag)
+        started_at = self._started_at.pop(delivery_tag, delivered_at)
+
+        if requeue:
+            self._broker.requeue(queue_name, message)
+        else:
+            self._broker.acknowledge(message, started_at)
+
+    def mark_started(self, delivery_tag: int):
+        """Отмечает начало обработки сообщения. Может вызываться из потока обработчика."""
+
+        self._started_at[delivery_tag] = time.time()
+
+    def start_consuming(self):
+        queue_name, on_message_callback, auto_ack = self._consumer
+        self._consuming = True
+
+        while self._consuming:
+            self._connection.process_threadsafe_callbacks()
+
+            if self._prefetch_count and len(self._unacked) >= self._prefetch_count:
+                time.sleep(0.005)
+                continue
+
+            message = self._broker.get(queue_name, timeout=0.05)
+
+            if message is None:
+                continue
+
+            body, _, redelivered = message
+            delivery = Delivery(self._next_delivery_tag, queue_name, redelivered)
+            self._next_delivery_tag += 1
+
+            if auto_ack:
+                self._broker.acknowledge(message, time.time())
+            else:
+                self._unacked[delivery.delivery_tag] = (queue_name, message, time.time())
+
+            on_message_callback(self, delivery, None, body)
+
+    def stop_consuming(self, consumer_tag=None):
+        self._consuming = False
+
+    def close(self):
+        """Закрывает канал. Неподтвержденные сообщения, как и в RabbitMQ, возвращаются в очередь."""
+
+        for queue_name, message, _ in self._unacked.values():
+            self._broker.requeue(queue_name, message)
+
+        self._unacked.clear()
+        self._started_at.clear()
+        self.is_open = False
+
+
+class StandInConnection:
+    """Соединение с заменителем RabbitMQ с подмножеством интерфейса pika.BlockingConnection."""
+
+    def __init__(self, broker: StandInBroker, parameters=None):
+        self.broker = broker
+        self._channels = []
+        self._callbacks = collections.deque()
+        self._callbacks_lock = threading.Lock()
+        self.is_open = True
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def channel(self) -> StandInChannel:
+        channel = StandInChannel(self)
+        self._channels.append(channel)
+
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        with self._callbacks_lock:
+            self._callbacks.append(callback)
+
+    def process_threadsafe_callbacks(self):
+        while True:
+            with self._callbacks_lock:
+                if not self._callbacks:
+                    return
+
+                callback = self._callbacks.popleft()
+
+            callback()
+
+    def process_data_events(self, time_limit: float = 0):
+        self.process_threadsafe_callbacks()
+
+    def close(self):
+        self.process_threadsafe_callbacks()
+
+        for channel in self._channels:
+            channel.close()
+
+        self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
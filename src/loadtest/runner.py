@@ -0,0 +1,238 @@
+import functools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+from dataclasses import (
+    dataclass,
+    field,
+)
+
+from loadtest.broker import (
+    StandInBroker,
+    StandInConnection,
+)
+from loadtest.servers import (
+    MBStubServer,
+    ToyzzFixtureServer,
+)
+
+
+MARKETPLACE_ID = 1
+PARSING_QUEUE = f'parsing.{MARKETPLACE_ID}'
+
+
+@dataclass
+class Scenario:
+    """Конфигурация прогона: количество процессов воркеров, задержка Markets-Bridge и переменные окружения."""
+
+    name: str
+    workers: int = 1
+    mb_latency_ms: int = 0
+    env: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_string(cls, value: str) -> 'Scenario':
+        """Создает сценарий из строки вида "workers=2,prefetch=4,mb_latency=50,CATEGORY_FANOUT=1".
+
+        Ключи в нижнем регистре - параметры стенда, остальные передаются воркерам как переменные окружения.
+        """
+
+        scenario = cls(name=value)
+
+        for item in filter(None, value.split(',')):
+            key, _, item_value = item.partition('=')
+            key = key.strip()
+            item_value = item_value.strip()
+
+            if key == 'workers':
+                scenario.workers = int(item_value)
+            elif key == 'mb_latency':
+                scenario.mb_latency_ms = int(item_value)
+            elif key == 'prefetch':
+                scenario.env['PREFETCH_COUNT'] = item_value
+            elif key.isupper():
+                scenario.env[key] = item_value
+            else:
+                raise ValueError(f'Unknown scenario parameter {key}.')
+
+        return scenario
+
+
+@dataclass
+class Workload:
+    """Набор сообщений, публикуемых в очередь перед запуском воркеров."""
+
+    products: int = 100
+    categories: int = 0
+    catalog_size: int = 1000
+    category_size: int = 60
+    page_padding_kb: int = 200
+    image_size: int = 1600
+    seed: int = 0
+
+    def get_messages(self, toyzz_url: str) -> list[dict]:
+        generator = random.Random(self.seed)
+        messages = [
+            {'type': 'PRODUCT', 'url': f'{toyzz_url}/p/{generator.randrange(self.catalog_size)}'}
+            for _ in range(self.products)
+        ]
+        # Категории пересекаются наполовину, поэтому их помещается вдвое больше, чем catalog_size / category_size
+        categories_count = max(2 * self.catalog_size // self.category_size - 1, 1)
+        messages.extend(
+            {'type': 'CATEGORY', 'url': f'{toyzz_url}/c/{generator.randrange(categories_count)}'}
+            for _ in range(self.categories)
+        )
+        generator.shuffle(messages)
+
+        return messages
+
+
+def run_scenario(scenario: Scenario, workload: Workload, timeout: float, verbose: bool = False) -> dict:
+    """Прогоняет нагрузку через воркеры main.py и возвращает отчет с пропускной способностью и задержками."""
+
+    context = multiprocessing.get_context('spawn')
+    storage_dir = tempfile.mkdtemp(prefix='toyzz-load-test-')
+    toyzz_server = ToyzzFixtureServer(
+        workload.category_size,
+        workload.page_padding_kb,
+        workload.image_size,
+        workload.seed,
+    ).start()
+    mb_server = MBStubServer(scenario.mb_latency_ms).start()
+    env = {
+        'MB_DOMAIN': f'{mb_server.url}/',
+        'MB_LOGIN': 'load-test',
+        'MB_PASSWORD': 'load-test',
+        'TOYZZ_ID': str(MARKETPLACE_ID),
+        'TOYZZ_DOMAIN': toyzz_server.url,
+        'SENTRY_DSN': '',
+        'LOCAL_STORAGE_PATH': os.path.join(storage_dir, 'storage.sqlite3'),
+        'PROFILING_DIR': os.path.join(storage_dir, 'profiles'),
+        **scenario.env,
+    }
+    queue_names = {PARSING_QUEUE, env.get('FANOUT_QUEUE') or PARSING_QUEUE}
+
+    try:
+        with context.Manager() as manager:
+            broker = StandInBroker(manager, sorted(queue_names))
+            resources = manager.list()
+
+            for message in workload.get_messages(toyzz_server.url):
+                broker.publish(PARSING_QUEUE, json.dumps(message).encode())
+
+            def start_worker_process():
+                process = context.Process(target=run_worker, args=(broker, env, resources, verbose))
+                process.start()
+
+                return process
+
+            started_at = time.perf_counter()
+            processes = [start_worker_process() for _ in range(scenario.workers)]
+
+            while broker.pending and time.perf_counter() - started_at < timeout:
+                time.sleep(0.1)
+
+                # Как и супервизор main.py, заменяем воркеры, завершившиеся по лимитам WorkerLimits
+                for index, process in enumerate(processes):
+                    if not process.is_alive():
+                        processes[index] = start_worker_process()
+
+            duration = time.perf_counter() - started_at
+            is_timed_out = bool(broker.pending)
+
+            for process in processes:
+                process.terminate()
+
+            for process in processes:
+                process.join()
+
+            return get_report(
+                scenario=scenario,
+                duration=duration,
+                is_timed_out=is_timed_out,
+                counters=broker.counters,
+                latencies=list(broker.latencies),
+                resources=list(resources),
+                toyzz_requests=toyzz_server.requests_count,
+                mb_requests=mb_server.requests_count,
+            )
+    finally:
+        toyzz_server.stop()
+        mb_server.stop()
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+
+def run_worker(broker: StandInBroker, env: dict, resources, verbose: bool):
+    """Точка входа процесса воркера: main.run_worker с подключением к заменителю RabbitMQ."""
+
+    # Окружение выставляется до импорта config, который читает его при импорте
+    os.environ.update(env)
+    logging.basicConfig(level=logging.INFO if verbose else logging.WARNING)
+
+    import pika
+
+    pika.BlockingConnection = functools.partial(StandInConnection, broker)
+
+    import main
+
+    process_message = main.callback
+
+    # Длительность обработки считается с момента, когда воркер начал обрабатывать сообщение, а не получил его
+    def callback(ch, method, properties, body):
+        ch.mark_started(method.delivery_tag)
+        process_message(ch, method, properties, body)
+
+    main.callback = callback
+    main.run_worker(is_child=True)
+
+    own_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    resources.append({
+        'cpu_time': own_usage.ru_utime + own_usage.ru_stime + children_usage.ru_utime + children_usage.ru_stime,
+        # ru_maxrss в Linux измеряется в килобайтах
+        'max_rss_mb': own_usage.ru_maxrss / 1024,
+    })
+
+
+def get_report(scenario: Scenario, duration: float, is_timed_out: bool, counters: dict, latencies: list[tuple],
+               resources: list[dict], toyzz_requests: int, mb_requests: int) -> dict:
+    end_to_end_latencies = sorted(latency for latency, _ in latencies)
+    processing_latencies = sorted(latency for _, latency in latencies)
+
+    return {
+        'scenario': scenario.name,
+        'workers': scenario.workers,
+        'timed_out': is_timed_out,
+        'messages': counters['acknowledged'],
+        'requeued': counters['requeued'],
+        'duration': round(duration, 2),
+        'throughput': round(counters['acknowledged'] / duration, 2) if duration else 0,
+        'latency': {
+            f'p{percent}': round(get_percentile(end_to_end_latencies, percent), 3) for percent in (50, 90, 99)
+        },
+        'processing': {
+            f'p{percent}': round(get_percentile(processing_latencies, percent), 3) for percent in (50, 90, 99)
+        },
+        'cpu_time': round(sum(usage['cpu_time'] for usage in resources), 2),
+        'max_rss_mb': round(max((usage['max_rss_mb'] for usage in resources), default=0), 1),
+        'toyzz_requests': toyzz_requests,
+        'mb_requests': mb_requests,
+    }
+
+
+def get_percentile(sorted_values: list[float], percent: int) -> float:
+    """Возвращает перцентиль методом ближайшего ранга."""
+
+    if not sorted_values:
+        return 0
+
+    rank = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+
+    return sorted_values[rank]
@@ -0,0 +1,239 @@
+import json
+import random
+import threading
+import time
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from io import (
+    BytesIO,
+)
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+
+PRODUCTS_PER_PAGE = 30
+
+
+class CountingServer(ThreadingHTTPServer):
+    """HTTP сервер, работающий в фоновом потоке и считающий обработанные запросы."""
+
+    daemon_threads = True
+
+    def __init__(self, handler_class):
+        super().__init__(('127.0.0.1', 0), handler_class)
+        self.requests_count = 0
+        self._counter_lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+
+        return f'http://{host}:{port}'
+
+    def count_request(self):
+        with self._counter_lock:
+            self.requests_count += 1
+
+    def start(self):
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class BaseHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ToyzzFixtureServer(CountingServer):
+    """Локальная замена toyzzshop.com, отдающая сгенерированные страницы.
+
+    Страницы:
+        /p/<номер> - карточка товара с двумя вариантами;
+        /c/<номер>?q=/page/<страница> - страница категории, категории частично пересекаются по товарам;
+        /img/<размер>/<имя>.jpg - изображение товара.
+
+    Остаток товара меняется от запроса к запросу, но зависит только от seed, номера товара и номера запроса к нему,
+    поэтому прогоны с одним seed воспроизводимы независимо от порядка запросов между воркерами.
+    """
+
+    def __init__(self, category_size: int = 60, page_padding_kb: int = 200, image_size: int = 1600, seed: int = 0):
+        super().__init__(ToyzzFixtureHandler)
+        self.category_size = category_size
+        self.seed = seed
+        self.padding = _get_padding(page_padding_kb)
+        self.image = _get_image(image_size, random.Random(seed))
+        self._product_requests = {}
+
+    def get_product_generator(self, number: int) -> random.Random:
+        """Возвращает генератор случайных чисел для очередного запроса карточки товара number."""
+
+        with self._counter_lock:
+            request_number = self._product_requests.get(number, 0)
+            self._product_requests[number] = request_number + 1
+
+        return random.Random(f'{self.seed}:{number}:{request_number}')
+
+
+class ToyzzFixtureHandler(BaseHandler):
+    server: ToyzzFixtureServer
+
+    def do_GET(self):
+        self.server.count_request()
+        parsed_url = urlparse(self.path)
+        parts = parsed_url.path.strip('/').split('/')
+
+        if len(parts) == 2 and parts[0] == 'p':
+            number = int(parts[1])
+            generator = self.server.get_product_generator(number)
+            body = get_product_page(number, self.server.url, self.server.padding, generator)
+            self.send_body(body.encode(), 'text/html; charset=utf-8')
+        elif len(parts) == 2 and parts[0] == 'c':
+            query = parse_qs(parsed_url.query).get('q', ['/page/1'])[0]
+            page = int(query.rsplit('/', 1)[-1])
+            body = get_category_page(int(parts[1]), page, self.server.category_size, self.server.padding)
+            self.send_body(body.encode(), 'text/html; charset=utf-8')
+        elif parts[0] == 'img':
+            self.send_body(self.server.image, 'image/jpeg')
+        else:
+            self.send_body(b'', 'text/plain', status=404)
+
+
+class MBStubServer(CountingServer):
+    """Заглушка API Markets-Bridge с настраиваемой задержкой ответа."""
+
+    def __init__(self, latency_ms: int = 0):
+        super().__init__(MBStubHandler)
+        self.latency = latency_ms / 1000
+        self._product_id = 0
+
+    def get_next_product_id(self) -> int:
+        with self._counter_lock:
+            self._product_id += 1
+
+            return self._product_id
+
+
+class MBStubHandler(BaseHandler):
+    server: MBStubServer
+
+    def do_POST(self):
+        self.server.count_request()
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+
+        if self.path.startswith('/api/token/'):
+            body = {'access': 'access-token', 'refresh': 'refresh-token'}
+        elif self.path.startswith('/api/v1/provider/products/'):
+            body = {'id': self.server.get_next_product_id()}
+        else:
+            body = {}
+
+        self.send_body(json.dumps(body).encode(), 'application/json', status=201)
+
+
+def get_product_page(number: int, base_url: str, padding: str, generator: random.Random) -> str:
+    """Возвращает HTML карточки товара в разметке, которую ожидает ProductCardParser.
+
+    Остатки вариантов берутся из generator.
+    """
+
+    serials = [
+        {
+            'id': number * 10 + variant,
+            'title': f'Renk {variant}',
+            'stock': generator.randint(0, 20),
+            'market_price': 100.0 + number,
+            'price': 90.0 + number,
+            'serial_code': f'SC{number}-{variant}',
+        }
+        for variant in (1, 2)
+    ]
+    images = ''.join(
+        f'<div><img class="rsTmb noDrag" src="{base_url}/img/300x300/{serial["id"]}-{index}.jpg" '
+        f'data-id="{serial["id"]}"></div>'
+        for serial in serials for index in (1, 2)
+    )
+
+    return f'''<html><head><title>Oyuncak {number}</title></head><body>
+<ol class="breadcrumb"><li>Ana Sayfa</li><li>Oyuncaklar</li><li>Oyuncak {number}</li></ol>
+<div class="gallery">{images}</div>
+<div class="product-specs">
+<div><span>Yaş Aralığı</span><span>: 3+</span></div>
+<div><span>Cinsiyet</span><span>: Unisex</span></div>
+<div><span>Malzeme</span><span>: Plastik</span></div>
+</div>
+<p>Ürün Ağırlığı: 1,2 kg</p>
+<p>Ürün ölçüsü: 10 x 20 x 30 cm</p>
+<div class="text fs-16"><br><p>Oyuncak {number} açıklaması.</p></div>
+<div class="padding">{padding}</div>
+<script>window['serials'] = {json.dumps(serials)}</script>
+<script>
+window.addEventListener("load", function() {{
+    var data ={{'name': 'Oyuncak {number}', 'brand': 'Marka', 'productGroupCode': '{number}', 'code': 'K{number}'}};
+    dataLayer.push(data);
+}});
+</script>
+</body></html>'''
+
+
+def get_category_page(number: int, page: int, category_size: int, padding: str) -> str:
+    """Возвращает HTML страницы категории.
+
+    Соседние категории пересекаются наполовину, как пересекаются реальные категории магазина.
+    """
+
+    first_product = number * category_size // 2
+    page_start = first_product + (page - 1) * PRODUCTS_PER_PAGE
+    page_end = min(page_start + PRODUCTS_PER_PAGE, first_product + category_size)
+    product_boxes = ''.join(
+        f'<div class="product-box"><a class="image" href="/p/{product}">Oyuncak {product}</a></div>'
+        for product in range(page_start, page_end)
+    )
+
+    return f'''<html><body>
+<span class="fs-16">{category_size} Ürün</span>
+<div class="products">{product_boxes}</div>
+<div class="padding">{padding}</div>
+</body></html>'''
+
+
+def _get_padding(size_kb: int) -> str:
+    """Возвращает разметку заданного размера, приближающую объем страниц к реальным."""
+
+    block = '<div class="filler"><span>lorem ipsum</span><a href="#">dolor</a></div>\n'
+
+    return block * (size_kb * 1024 // len(block))
+
+
+def _get_image(size: int, generator: random.Random) -> bytes:
+    """Возвращает JPEG изображение size x size. Без Pillow возвращаются случайные байты такого же порядка размера."""
+
+    try:
+        from PIL import (
+            Image,
+        )
+    except ImportError:
+        return generator.randbytes(size * size // 4)
+
+    image = Image.frombytes('RGB', (size, size), generator.randbytes(size * size * 3))
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=95)
+
+    return output.getvalue()
@@ -1,16 +1,28 @@
 #!/usr/bin/env python
+import functools
 import json
 import logging
+import multiprocessing
+import signal
+import sys
+import threading
+import time
 
 import pika
-import sentry_sdk
 
 import config
 from core.enums import (
     EntityType,
 )
-from core.utils import (
-    handle_exception,
+from core.memory import (
+    WorkerLimits,
+)
+from core.pipeline import (
+    PipelineStopped,
+    stop_running_pipelines,
+)
+from core.profiling import (
+    profile_message,
 )
 
 
@@ -19,29 +31,247 @@ def callback(ch, method, properties, body):
         message = json.loads(body)
         processing_type = message['type']
         processing_url = message['url']
+        processing_options = dict(message.get('options', {}))
+        # Флаг профилирования обрабатывается здесь и не передается в функцию обработки
+        is_profiled = bool(processing_options.pop('profile', False))
 
         logging.info(f'{processing_type.lower().capitalize()} was received for parsing. URL: {processing_url}')
 
         processing_function = EntityType.get_processing_function_for_entity_type(processing_type)
-        processing_function(processing_url)
+
+        with profile_message(processing_type, processing_url, force=is_profiled):
+            processing_function(processing_url, **processing_options)
+    except PipelineStopped:
+        # Прерванное остановкой воркера сообщение вернется в очередь
+        raise
     except Exception as e:
+        from core.utils import (
+            handle_exception,
+        )
+
         handle_exception(e)
         return
 
 
-if __name__ == '__main__':
+class Worker:
+    """Потребитель очереди парсинга.
+
+    Сообщения обрабатываются по одному в отдельном потоке, чтобы во время долгой обработки соединение с RabbitMQ
+    продолжало обслуживать heartbeat. Сообщение подтверждается только после обработки, поэтому при остановке или
+    падении воркера необработанные сообщения возвращаются в очередь.
+
+    При остановке запущенные конвейеры дообрабатывают текущие элементы, и воркер до WORKER_STOP_TIMEOUT секунд
+    ждет завершения обработки сообщения, прежде чем закрыть соединение. Сообщение, обработку которого прервала
+    остановка конвейера (PipelineStopped), возвращается в очередь, чтобы его дообработал другой воркер. Сообщение,
+    обработка которого успела завершиться, подтверждается.
+
+    Если сообщение не удалось обработать из-за непредвиденной ошибки, воркер останавливается с флагом is_failed.
+    Сообщение возвращается в очередь один раз, а при повторной ошибке отбрасывается, чтобы не падать на нем
+    бесконечно.
+    """
+
+    def __init__(self):
+        self.is_failed = False
+        self._limits = WorkerLimits()
+        self._processing_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._connection = None
+        self._channel = None
+
+    def run(self):
+        connection_parameters = pika.ConnectionParameters(
+            host=config.rabbitmq_host,
+            heartbeat=300,
+            blocked_connection_timeout=300,
+        )
+        with pika.BlockingConnection(connection_parameters) as connection:
+            self._connection = connection
+            self._channel = connection.channel()
+            self._channel.queue_declare(config.consume_queue)
+            self._channel.basic_qos(prefetch_count=config.prefetch_count)
+            self._channel.basic_consume(config.consume_queue, self._on_message)
+            self._channel.start_consuming()
+            self._wait_for_processing()
+
+    def stop(self):
+        """Прекращает прием сообщений и останавливает конвейеры.
+
+        Может вызываться из любого потока и из обработчика сигнала.
+        """
+
+        self._stopping.set()
+        stop_running_pipelines()
+
+        if self._connection:
+            self._connection.add_callback_threadsafe(self._channel.stop_consuming)
+
+    def _wait_for_processing(self):
+        # Подтверждение текущего сообщения должно уйти до закрытия соединения
+        if self._processing_lock.acquire(timeout=config.worker_stop_timeout):
+            self._processing_lock.release()
+        else:
+            logging.warning('Message processing was not finished in time. The message will be returned to the queue')
+
+        self._connection.process_data_events(time_limit=0)
+
+    def _on_message(self, ch, method, properties, body):
+        thread = threading.Thread(target=self._process_message, args=(ch, method, properties, body), daemon=True)
+        thread.start()
+
+    def _process_message(self, ch, method, properties, body):
+        with self._processing_lock:
+            # Неподтвержденное сообщение вернется в очередь при закрытии соединения
+            if self._stopping.is_set():
+                return
+
+            is_processed = False
+            is_interrupted = False
+
+            try:
+                callback(ch, method, properties, body)
+                is_processed = True
+            except PipelineStopped:
+                is_interrupted = True
+            except Exception:
+                # callback сам обрабатывает ошибки, сюда попадают только ошибки их обработки (например, недоступен
+                # Markets-Bridge для записи лога)
+                logging.exception('Message processing failed unexpectedly. The worker is stopped')
+            finally:
+                if is_interrupted:
+                    # Обработку прервала остановка воркера, поэтому сообщение возвращается в очередь
+                    self._connection.add_callback_threadsafe(
+                        functools.partial(ch.basic_nack, delivery_tag=method.delivery_tag, requeue=True),
+                    )
+                elif not is_processed:
+                    # Воркер завершается, чтобы супервизор запустил новый, а сообщение возвращается в очередь только
+                    # при первой доставке
+                    is_requeued = not method.redelivered
+
+                    if not is_requeued:
+                        logging.error(f'Message failed again after redelivery and is dropped: {body!r}')
+
+                    self._connection.add_callback_threadsafe(
+                        functools.partial(ch.basic_nack, delivery_tag=method.delivery_tag, requeue=is_requeued),
+                    )
+                    self.is_failed = True
+                    self.stop()
+
+            if not is_processed:
+                return
+
+            self._connection.add_callback_threadsafe(
+                functools.partial(ch.basic_ack, delivery_tag=method.delivery_tag),
+            )
+            self._limits.register_message()
+
+            if self._limits.is_exceeded():
+                self.stop()
+
+
+def run_worker(is_child: bool = False) -> int:
+    """Запускает воркер в текущем процессе и возвращает код завершения: 1, если воркер остановлен из-за ошибки."""
+
+    if is_child:
+        # Дочерние процессы останавливает супервизор сигналом SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        setup()
+
+    worker = Worker()
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+    return int(worker.is_failed)
+
+
+def run_worker_process():
+    """Точка входа дочернего процесса воркера."""
+
+    sys.exit(run_worker(is_child=True))
+
+
+# Максимальная задержка перезапуска воркера, завершившегося с ошибкой (в секундах)
+MAX_RESTART_DELAY = 60
+
+
+def supervise():
+    """Запускает WORKER_PROCESSES процессов воркеров и перезапускает завершившиеся.
+
+    Воркер завершается сам, когда превышает лимиты WorkerLimits или не может обработать сообщение из-за
+    непредвиденной ошибки, после чего вместо него запускается новый. Воркер, завершившийся с ошибкой,
+    перезапускается с задержкой, которая удваивается при каждой следующей ошибке подряд, до MAX_RESTART_DELAY
+    секунд. Штатное завершение и работа дольше MAX_RESTART_DELAY секунд сбрасывают задержку.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    def start_worker_process():
+        process = context.Process(target=run_worker_process)
+        process.start()
+
+        return process
+
+    processes = [start_worker_process() for _ in range(config.worker_processes)]
+    started_at = [time.monotonic()] * config.worker_processes
+    restart_delays = [0] * config.worker_processes
+    restart_at = [None] * config.worker_processes
+
+    try:
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+
+            for index, process in enumerate(processes):
+                if process is not None and process.is_alive():
+                    continue
+
+                if process is not None:
+                    is_long_running = now - started_at[index] > MAX_RESTART_DELAY
+
+                    if process.exitcode == 0 or is_long_running:
+                        restart_delays[index] = 0
+
+                    if process.exitcode != 0:
+                        restart_delays[index] = min(max(restart_delays[index] * 2, 1), MAX_RESTART_DELAY)
+
+                    restart_at[index] = now + restart_delays[index]
+                    processes[index] = None
+                    logging.info(
+                        f'Worker {process.pid} exited with code {process.exitcode}. '
+                        f'A new one will be started in {restart_delays[index]} s'
+                    )
+
+                if now >= restart_at[index]:
+                    processes[index] = start_worker_process()
+                    started_at[index] = now
+    except KeyboardInterrupt:
+        running_processes = [process for process in processes if process is not None]
+
+        for process in running_processes:
+            process.terminate()
+
+        for process in running_processes:
+            process.join()
+
+
+def setup():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
 
     if config.sentry_dsn:
+        import sentry_sdk
+
         sentry_sdk.init(dsn=config.sentry_dsn, enable_tracing=True)
 
-    connection_parameters = pika.ConnectionParameters(host='localhost', heartbeat=300, blocked_connection_timeout=300)
-    with pika.BlockingConnection(connection_parameters) as connection:
-        channel = connection.channel()
-        channel.queue_declare(f'parsing.{config.marketplace_id}')
-        channel.basic_consume(f'parsing.{config.marketplace_id}', callback, auto_ack=True)
 
-        try:
-            channel.start_consuming()
-        except KeyboardInterrupt:
-            pass
+if __name__ == '__main__':
+    setup()
+    config.validate()
+
+    if config.worker_processes > 1 or WorkerLimits().is_enabled:
+        supervise()
+    else:
+        sys.exit(run_worker())
@@ -96,21 +96,21 @@ class CharacteristicValueSender(BaseSender):
         return cls._send(obj, url=config.mb_characteristic_values_url)
 
 
-def send_image(image: bytes, product_id: int):
+def send_image(image: bytes, product_id: int, extension: str = 'jpg'):
     """Отправляет изображение в виде байтов в систему Markets-Bridge, присваивая его товару с product_id."""
 
     headers = get_authorization_headers()
     response = requests.post(
         config.mb_product_images_url,
         data={'product': product_id},
-        files={'image': (f'{uuid.uuid4().hex}.jpg', image)},
+        files={'image': (f'{uuid.uuid4().hex}.{extension}', image)},
         headers=headers,
     )
 
     if response.status_code == 401:
         accesser = Accesser()
         accesser.update_access_token()
-        response = send_image(image, product_id)
+        response = send_image(image, product_id, extension)
 
     response.raise_for_status()
 
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+import logging
+
+import config
+from core.scheduling import (
+    run_refresh_scheduler,
+)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+
+    config.validate()
+
+    try:
+        run_refresh_scheduler()
+    except KeyboardInterrupt:
+        pass
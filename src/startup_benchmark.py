@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Замер времени холодного старта воркера.
+
+Каждый сценарий запускается в отдельном интерпретаторе, чтобы модули не были закэшированы в sys.modules:
+    consumer - импорт main.py, то есть готовность начать прием сообщений;
+    product - consumer + загрузка обработчика товаров;
+    category - consumer + загрузка обработчика категорий вместе с Selenium.
+
+Запуск:
+    python src/startup_benchmark.py --runs 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+SCENARIOS = {
+    'consumer': 'import main',
+    'product': (
+        'import main\n'
+        'main.EntityType.get_processing_function_for_entity_type("PRODUCT")'
+    ),
+    'category': (
+        'import main\n'
+        'main.EntityType.get_processing_function_for_entity_type("CATEGORY")\n'
+        'from selenium import webdriver'
+    ),
+}
+
+
+def measure(code: str, runs: int) -> list[float]:
+    """Возвращает время (в секундах) выполнения code в новом интерпретаторе для каждого запуска."""
+
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {
+        **os.environ,
+        'MB_DOMAIN': os.getenv('MB_DOMAIN', 'http://localhost/'),
+        'TOYZZ_ID': os.getenv('TOYZZ_ID', '1'),
+    }
+    timings = []
+
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=src_dir, env=env, check=True)
+        timings.append(time.perf_counter() - started_at)
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time benchmark')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append')
+    args = parser.parse_args()
+
+    for name in args.scenario or SCENARIOS:
+        timings = measure(SCENARIOS[name], args.runs)
+        print(
+            f'{name:<10} median: {statistics.median(timings) * 1000:8.1f} ms | '
+            f'min: {min(timings) * 1000:8.1f} ms | max: {max(timings) * 1000:8.1f} ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
+import atexit
+import hashlib
 import html
 import json
+import logging
 import re
+import shutil
+import tempfile
+import zlib
 from abc import (
     ABC,
     abstractmethod,
@@ -13,18 +19,15 @@ from urllib.parse import (
     urlparse,
     urlunparse,
 )
+from xml.etree.ElementTree import (
+    XMLPullParser,
+)
 
 import requests
 from bs4 import (
     BeautifulSoup,
     NavigableString,
 )
-from selenium import (
-    webdriver,
-)
-from selenium.webdriver.chrome.options import (
-    Options,
-)
 
 import config
 from toyzz.dtos import (
@@ -45,66 +48,111 @@ class BaseParser(ABC):
         """Возвращает данные, полученные по переданному url."""
 
 
-class CategoryParser(BaseParser):
+class CategoryParser:
     """Парсер категорий.
 
-    Позволяет получить товары из целой категории (поиска) в магазине.
+    Позволяет получить ссылки на товары из целой категории (поиска) в магазине. Карточки по ссылкам
+    обрабатываются по одной (core.utils.category_processing) с учетом индекса недавно обработанных карточек.
     """
 
-    @classmethod
-    def parse(cls, url: str) -> list[ToyzzProductDTO]:
-        response_text = cls.send_category_request(url)
+    products_per_page = 30
 
-        soup = BeautifulSoup(response_text, 'html.parser')
-        product_tags = soup.find_all('div', class_='product-box')
+    @classmethod
+    def get_product_urls(cls, url: str) -> list[str]:
+        """Возвращает очищенные ссылки на все карточки товаров категории."""
 
         product_urls = []
 
-        for tag in product_tags:
-            a_tag = tag.find('a', class_='image')
+        for _, _, page_product_urls in cls.iter_page_product_urls(url):
+            product_urls.extend(page_product_urls)
 
-            if a_tag:
-                product_urls.append(a_tag['href'])
+        return product_urls
 
-        product_quantity_tag = soup.find('span', class_='fs-16')
-        product_quantity = int(re.sub('[^0-9]', '', product_quantity_tag.text))
+    @classmethod
+    def iter_page_product_urls(cls, url: str, start_page: int = 1, pages_count: int = None):
+        """Генератор очищенных ссылок на карточки товаров, постранично.
 
-        pages_count = ceil(product_quantity / 30)
+        Возвращает кортежи (номер страницы, количество страниц, ссылки). Ссылки, уже встреченные на предыдущих
+        страницах категории, повторно не возвращаются.
 
-        # FIXME: Захардкоженная двойка
-        for page in range(2, pages_count + 1):
-            response_text = cls.send_category_request(url, page=page)
-            soup = BeautifulSoup(response_text, 'html.parser')
-            product_tags = soup.find_all('div', class_='product-box')
+        Args:
+            url: адрес категории;
+            start_page: страница, с которой начинается обход;
+            pages_count: известное количество страниц. Если не передано, определяется по первой загруженной
+                странице.
+        """
 
-            for tag in product_tags:
-                a_tag = tag.find('a', class_='image')
+        seen_urls = set()
+        page = start_page
 
-                if a_tag and 'product.link_name' not in a_tag['href']:
-                    product_urls.append(a_tag['href'])
+        # Один браузер на все страницы категории, чтобы не запускать Chrome для каждой страницы
+        with create_listing_driver() as driver:
+            while pages_count is None or page <= pages_count:
+                response_text = cls.send_category_request(url, page=page, driver=driver)
+                soup = BeautifulSoup(response_text, 'html.parser')
 
-        marketplace_url = config.toyzz_domain
-        product_urls = {clean_query_in_url(f'{marketplace_url}{url}') for url in product_urls}
-        products = []
+                if pages_count is None:
+                    product_quantity_tag = soup.find('span', class_='fs-16')
+                    product_quantity = int(re.sub('[^0-9]', '', product_quantity_tag.text))
+                    pages_count = ceil(product_quantity / cls.products_per_page)
 
-        from core.utils import (
-            handle_exception,
-        )
+                page_product_urls = []
 
-        for product_url in product_urls:
-            if '{{' in product_url:
-                continue
+                for product_url in cls._get_product_urls_from_page(soup):
+                    if product_url not in seen_urls:
+                        seen_urls.add(product_url)
+                        page_product_urls.append(product_url)
+
+                soup.decompose()
+                del response_text
+
+                yield page, pages_count, page_product_urls
+
+                page += 1
+
+    @staticmethod
+    def _get_product_urls_from_page(soup: BeautifulSoup) -> list[str]:
+        product_tags = soup.find_all('div', class_='product-box')
+        product_urls = []
 
-            try:
-                products.extend(ProductCardParser.parse(product_url))
-            except Exception as e:
-                handle_exception(e)
+        for tag in product_tags:
+            a_tag = tag.find('a', class_='image')
+
+            # Незаполненные шаблоны карточек, которые отрисовываются на клиенте
+            if not a_tag or 'product.link_name' in a_tag['href'] or '{{' in a_tag['href']:
                 continue
 
-        return products
+            product_urls.append(clean_query_in_url(f'{config.toyzz_domain}{a_tag["href"]}'))
+
+        return product_urls
 
     @classmethod
-    def send_category_request(cls, url: str, page: int = 1) -> str:
+    def send_category_request(cls, url: str, page: int = 1, driver=None) -> str:
+        """Возвращает HTML страницы категории после отрисовки списка товаров.
+
+        Args:
+            url: адрес категории;
+            page: номер страницы;
+            driver: запущенный браузер. Если не передан, запускается новый на время запроса.
+        """
+
+        if driver is None:
+            with create_listing_driver() as driver:
+                return cls.send_category_request(url, page, driver)
+
+        from selenium.common.exceptions import (
+            TimeoutException,
+        )
+        from selenium.webdriver.common.by import (
+            By,
+        )
+        from selenium.webdriver.support import (
+            expected_conditions,
+        )
+        from selenium.webdriver.support.wait import (
+            WebDriverWait,
+        )
+
         page_parameter = '/page/'
 
         if has_query(url):
@@ -112,16 +160,89 @@ class CategoryParser(BaseParser):
         else:
             url = f'{url}?q={page_parameter}{page}'
 
-        chrome_options = Options()
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--disable-dev-shm-usage')
+        driver.get(url)
+
+        try:
+            WebDriverWait(driver, config.selenium_wait_timeout).until(
+                expected_conditions.presence_of_element_located((By.CSS_SELECTOR, 'div.product-box a.image')),
+            )
+        except TimeoutException:
+            logging.warning(f'Product grid was not found on the category page in time. URL: {url}')
+
+        return driver.page_source
+
+
+_listing_chrome_options = None
+_listing_profile_dir = None
+
+
+def get_listing_chrome_options():
+    """Возвращает настройки Chrome для загрузки страниц категорий, подготавливая их при первом обращении.
+
+    Картинки, медиа, шрифты и трекеры не загружаются, страница считается загруженной после построения DOM
+    (стратегия eager). Если задан SELENIUM_PROFILE_DIR, подготовленный профиль копируется во временную директорию
+    процесса, чтобы браузеры нескольких воркеров не блокировали друг другу профиль.
+    """
+
+    global _listing_chrome_options, _listing_profile_dir
+
+    if _listing_chrome_options is not None:
+        return _listing_chrome_options
+
+    # Selenium импортируется здесь, чтобы воркеры, не обрабатывающие категории, не тратили время на его загрузку
+    from selenium.webdriver.chrome.options import (
+        Options,
+    )
+
+    chrome_options = Options()
+    chrome_options.page_load_strategy = 'eager'
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--disable-extensions')
+    chrome_options.add_argument('--mute-audio')
+    chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+    chrome_options.add_experimental_option('prefs', {
+        'profile.managed_default_content_settings.images': 2,
+        'profile.managed_default_content_settings.media_stream': 2,
+        'profile.default_content_setting_values.notifications': 2,
+    })
+
+    if config.selenium_profile_dir:
+        _listing_profile_dir = tempfile.mkdtemp(prefix='toyzz-chrome-')
+        shutil.copytree(config.selenium_profile_dir, _listing_profile_dir, dirs_exist_ok=True)
+        atexit.register(shutil.rmtree, _listing_profile_dir, ignore_errors=True)
+        chrome_options.add_argument(f'--user-data-dir={_listing_profile_dir}')
+
+    _listing_chrome_options = chrome_options
+
+    return _listing_chrome_options
+
+
+def create_listing_driver():
+    """Запускает Chrome для загрузки страниц категорий.
 
-        with webdriver.Chrome(options=chrome_options) as driver:
-            driver.get(url)
-            page_source = driver.page_source
+    Возвращаемый браузер используется как контекстный менеджер и закрывается при выходе из него.
+    """
+
+    from selenium import (
+        webdriver,
+    )
+
+    driver = webdriver.Chrome(options=get_listing_chrome_options())
+
+    try:
+        driver.set_page_load_timeout(config.selenium_page_load_timeout)
 
-        return page_source
+        if config.selenium_blocked_urls:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': config.selenium_blocked_urls})
+    except Exception:
+        driver.quit()
+        raise
+
+    return driver
 
 
 class ProductCardParser(BaseParser):
@@ -134,16 +255,18 @@ class ProductCardParser(BaseParser):
     def parse(cls, url: str) -> list[ToyzzProductDTO]:
         response = requests.get(url)
         response.raise_for_status()
+        response_text = response.text
+        del response
 
         product_detail_data_re_pattern = r"<script>\s*window\['serials'\]\s*=\s*(?P<json_data>.*?)\s*</script>"
-        detail_data_matches = re.search(product_detail_data_re_pattern, response.text)
+        detail_data_matches = re.search(product_detail_data_re_pattern, response_text)
         detail_data_str = detail_data_matches.group('json_data')
 
         product_common_data_re_pattern = (
             r'<script>\s*window\.addEventListener\("load", function\(\) '
             r'{\s*var data =({.*?});\s+dataLayer\.push\(data\);\s*}\);\s*</script>'
         )
-        common_data_matches = re.search(product_common_data_re_pattern, response.text, re.DOTALL)
+        common_data_matches = re.search(product_common_data_re_pattern, response_text, re.DOTALL)
         common_data_str = common_data_matches.group(1)
         common_data_str_clean = re.sub(r'//[^\n]*', '', common_data_str)
 
@@ -153,10 +276,13 @@ class ProductCardParser(BaseParser):
         brand_name = html.unescape(common_data['brand'])
         brand = ToyzzBrandDTO(brand_name)
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(response_text, 'html.parser')
+        del response_text
 
         image_tags = soup.find_all('img', class_='rsTmb noDrag')
         image_tags = list(filter(lambda x: 'data-rsvideo' not in x.parent.attrs, image_tags))
+        # Пары (адрес оригинала, идентификатор варианта), чтобы не держать ссылки на теги после разбора
+        images = [(tag.get('src').replace('300x300', 'orj'), tag.get('data-id')) for tag in image_tags]
 
         product_specs = soup.find(attrs={'class': 'product-specs'})
         product_specs = list(filter(lambda x: not isinstance(x, NavigableString), product_specs.contents))
@@ -210,6 +336,10 @@ class ProductCardParser(BaseParser):
         category_name = html.unescape(category_tags[-2].text)
         category = ToyzzCategoryDTO(category_name)
 
+        # Дерево разбора больше не нужно. Оно состоит из циклических ссылок, поэтому без явного разрушения
+        # освобождается только сборщиком мусора
+        soup.decompose()
+
         cleaned_url = clean_query_in_url(url)
 
         products = []
@@ -218,12 +348,12 @@ class ProductCardParser(BaseParser):
 
         for product_unit in product_card_data:
             if len(product_card_data) == 1:
-                image_urls = [tag.get('src').replace('300x300', 'orj') for tag in image_tags]
+                image_urls = [image_url for image_url, _ in images]
                 name = common_title
             else:
                 image_urls = [
-                    tag.get('src').replace('300x300', 'orj') for tag in image_tags
-                    if int(tag.get('data-id')) == product_unit['id']
+                    image_url for image_url, product_unit_id in images
+                    if int(product_unit_id) == product_unit['id']
                 ]
                 name = f'{common_title}, {product_unit["title"]}'
 
@@ -254,6 +384,126 @@ class ProductCardParser(BaseParser):
         return products
 
 
+class CatalogParser:
+    """Парсер всего каталога магазина.
+
+    Ссылки на товары читаются потоково из индекса sitemap и sitemap товаров, нормализуются, дедуплицируются и
+    распределяются по шардам, чтобы каталог можно было обойти несколькими воркерами параллельно. Карточки по
+    полученным ссылкам обрабатываются по одной (core.utils.catalog_processing), поэтому товары всего шарда не
+    накапливаются в памяти.
+    """
+
+    chunk_size = 64 * 1024
+
+    @classmethod
+    def get_product_urls(cls, url: str, shard_index: int = 0, shard_count: int = 1):
+        """Генератор ссылок на карточки товаров, относящихся к шарду shard_index из shard_count.
+
+        Args:
+            url: адрес индекса sitemap или sitemap товаров;
+            shard_index: номер шарда, начиная с 0;
+            shard_count: общее количество шардов.
+        """
+
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f'Shard index {shard_index} is out of range for {shard_count} shards.')
+
+        seen_urls = set()
+
+        for product_url in cls._iter_sitemap_product_urls(url):
+            product_url = clean_query_in_url(product_url)
+
+            # Шард зависит только от url, поэтому дедуплицируются только ссылки своего шарда
+            if get_url_shard(product_url, shard_count) != shard_index or product_url in seen_urls:
+                continue
+
+            seen_urls.add(product_url)
+
+            yield product_url
+
+    @classmethod
+    def _iter_sitemap_product_urls(cls, url: str):
+        for tag, location in cls._iter_sitemap_locations(url):
+            if tag == 'sitemap':
+                if config.catalog_sitemap_filter in location:
+                    yield from cls._iter_sitemap_product_urls(location)
+            elif location.startswith(config.toyzz_domain):
+                yield location
+
+    @classmethod
+    def _iter_sitemap_locations(cls, url: str):
+        """Генератор пар (тег записи, адрес) из sitemap.
+
+        Документ разбирается инкрементально по мере загрузки, разобранные элементы сразу освобождаются, поэтому
+        расход памяти не зависит от размера sitemap. Тег записи - "sitemap" для индекса и "url" для списка страниц.
+        """
+
+        parser = XMLPullParser(events=('start', 'end'))
+        root = None
+        # Файлы .gz отдаются как есть, без Content-Encoding, поэтому распаковываются здесь
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if urlparse(url).path.endswith('.gz') else None
+
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+
+            for chunk in response.iter_content(chunk_size=cls.chunk_size):
+                if decompressor:
+                    chunk = decompressor.decompress(chunk)
+
+                parser.feed(chunk)
+                root = yield from cls._read_sitemap_events(parser, root)
+
+        if decompressor:
+            parser.feed(decompressor.flush())
+
+        parser.close()
+        # Хвост документа разбирается только при flush и close, поэтому события читаются еще раз
+        yield from cls._read_sitemap_events(parser, root)
+
+    @staticmethod
+    def _read_sitemap_events(parser: XMLPullParser, root):
+        """Генератор пар (тег записи, адрес) из накопленных событий parser. Возвращает корневой элемент документа."""
+
+        for event, element in parser.read_events():
+            if root is None:
+                root = element
+
+            if event != 'end':
+                continue
+
+            tag = _local_name(element.tag)
+
+            if tag in ('sitemap', 'url'):
+                location = next(
+                    (child.text for child in element if _local_name(child.tag) == 'loc' and child.text),
+                    None,
+                )
+
+                if location:
+                    yield tag, location.strip()
+
+                root.clear()
+
+        return root
+
+
+def get_url_shard(url: str, shard_count: int) -> int:
+    """Возвращает номер шарда для url.
+
+    Используется стабильный хэш, чтобы распределение не менялось между процессами и узлами.
+    """
+
+    url_hash = hashlib.md5(url.encode()).hexdigest()
+
+    return int(url_hash, 16) % shard_count
+
+
+def _local_name(tag: str) -> str:
+    """Возвращает имя XML тега без пространства имен."""
+
+    return tag.rsplit('}', 1)[-1]
+
+
 def clean_query_in_url(url: str) -> str:
     """Возвращает url с очищенными параметрами."""
 